@@ -0,0 +1,152 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Union
+
+import os
+import threading
+import zipfile
+
+from catkin_tools.common import mkdir_p
+
+from .assets import COMPRESSION_FORMATS
+
+# Archive holding everything in the docs space which isn't a package's generated API docs:
+# the top-level index and the per-package summary, message and service pages.
+SUMMARY_ARCHIVE = "_summary"
+
+# Subdirectories of a package's docs which the package job produces. Only html/ is published,
+# doxygen's xml/ is an intermediate output.
+PACKAGE_OUTPUT_SUBDIRS = ("html", "xml")
+
+# Already-compressed formats are stored rather than deflated again.
+_STORED_EXTENSIONS = (".gif", ".jpg", ".png", ".woff", ".woff2") + tuple("." + fmt for fmt in COMPRESSION_FORMATS)
+
+
+def archive_file(archive_dir: str, name: str) -> str:
+    return os.path.join(archive_dir, "%s.zip" % name)
+
+
+def _write_archive(dest_path, entries):
+    """Write (path, arcname) entries to a zip archive, replacing dest_path atomically once complete."""
+    mkdir_p(os.path.dirname(dest_path))
+    tmp_path = dest_path + ".tmp"
+    count = 0
+    with zipfile.ZipFile(tmp_path, "w", allowZip64=True) as zf:
+        for path, arcname in entries:
+            compress_type = zipfile.ZIP_STORED if path.endswith(_STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+            zf.write(path, arcname, compress_type=compress_type)
+            count += 1
+    os.replace(tmp_path, dest_path)
+    return count
+
+
+def _walk(path, root_path, skip_dir=None):
+    for dirpath, dirnames, filenames in os.walk(path):
+        if skip_dir is not None:
+            dirnames[:] = [d for d in dirnames if not skip_dir(os.path.relpath(os.path.join(dirpath, d), root_path))]
+        for filename in sorted(filenames):
+            file_path = os.path.join(dirpath, filename)
+            yield file_path, os.path.relpath(file_path, root_path)
+
+
+def archive_package_docs(logger, event_queue, docs_space: str, package_name: str, archive_dir: str) -> int:
+    """
+    FunctionStage functor that packs a package's generated API docs into a single zip archive.
+
+    Entries are named relative to the docs space (eg, "roscpp/html/index.html"), so a URL path maps
+    directly onto an entry name.
+
+    :param logger:
+    :param event_queue:
+    :param docs_space: Root of the docs space
+    :param package_name: Package whose docs are archived
+    :param archive_dir: Directory in which to write <package_name>.zip
+    :return: return code
+    """
+    html_path = os.path.join(docs_space, package_name, "html")
+    count = _write_archive(archive_file(archive_dir, package_name), _walk(html_path, docs_space))
+    logger.out("Archived %d files." % count)
+    return 0
+
+
+def archive_summary_docs(logger, event_queue, docs_space: str, archive_dir: str) -> int:
+    """
+    FunctionStage functor that packs everything in the docs space except the packages' own outputs
+    (see archive_package_docs) into the summary archive.
+
+    :param logger:
+    :param event_queue:
+    :param docs_space: Root of the docs space
+    :param archive_dir: Directory in which to write the summary archive
+    :return: return code
+    """
+    archive_dir_rel = os.path.relpath(archive_dir, docs_space)
+
+    def skip_dir(rel_path):
+        parts = rel_path.split(os.sep)
+        return rel_path == archive_dir_rel or (len(parts) == 2 and parts[1] in PACKAGE_OUTPUT_SUBDIRS)
+
+    count = _write_archive(archive_file(archive_dir, SUMMARY_ARCHIVE), _walk(docs_space, docs_space, skip_dir))
+    logger.out("Archived %d files." % count)
+    return 0
+
+
+class DocsArchiveReader(object):
+    """Looks up docs space paths in the archives written by archive_package_docs and archive_summary_docs.
+
+    Archives are opened on first use and kept open; the zip central directory serves as the index, so
+    a lookup reads only the requested entry.
+    """
+
+    def __init__(self, archive_dir: str):
+        self.archive_dir = archive_dir
+        self._archives = {}
+        self._lock = threading.Lock()
+
+    def _archive(self, name):
+        path = archive_file(self.archive_dir, name)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        cached = self._archives.get(name)
+        if cached is None or cached[0] != mtime:
+            # Archives are replaced atomically when rewritten, reopen to see the new index.
+            if cached is not None:
+                cached[1].close()
+            cached = self._archives[name] = (mtime, zipfile.ZipFile(path))
+        return cached[1]
+
+    def read(self, rel_path: str) -> Union[bytes, None]:
+        """Return the contents of a docs space path, or None if no archive holds it."""
+        rel_path = rel_path.lstrip("/")
+        with self._lock:
+            for name in (rel_path.split("/", 1)[0], SUMMARY_ARCHIVE):
+                if not name or name.startswith("."):
+                    continue
+                archive = self._archive(name)
+                if archive is None:
+                    continue
+                try:
+                    return archive.read(rel_path)
+                except KeyError:
+                    continue
+        return None
+
+    def close(self):
+        with self._lock:
+            for _, archive in self._archives.values():
+                archive.close()
+            self._archives.clear()
@@ -0,0 +1,229 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Iterable
+from typing import List
+
+import gzip
+import os
+import shutil
+
+from catkin_tools.execution.events import ExecutionEvent
+
+from .manifest import is_package_docs
+from .util import file_digest
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Present in the docs space root once assets have been hardlinked, see release_shared_assets.
+DEDUPE_MARKER = ".deduplicated"
+
+STATIC_EXTENSIONS = (
+    ".css",
+    ".eot",
+    ".gif",
+    ".ico",
+    ".jpg",
+    ".js",
+    ".map",
+    ".png",
+    ".svg",
+    ".ttf",
+    ".woff",
+    ".woff2",
+)
+
+COMPRESSIBLE_EXTENSIONS = (".css", ".html", ".js", ".json", ".svg", ".txt", ".xml")
+
+COMPRESSION_FORMATS = ("gz", "br")
+
+# Pre-compressed static assets are as duplicated as their sources.
+SHARED_EXTENSIONS = STATIC_EXTENSIONS + tuple(
+    "%s.%s" % (ext, fmt) for ext in STATIC_EXTENSIONS for fmt in COMPRESSION_FORMATS
+)
+
+
+def _walk_files(path: str, extensions: Iterable[str]):
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            if filename.endswith(tuple(extensions)):
+                yield os.path.join(dirpath, filename)
+
+
+def _progress(logger, event_queue, index, total):
+    event_queue.put(
+        ExecutionEvent(
+            "STAGE_PROGRESS",
+            job_id=logger.job_id,
+            stage_label=logger.stage_label,
+            percent=str(int(100 * index / float(max(total, 1)))),
+        )
+    )
+
+
+def deduplicate_static_assets(logger, event_queue, docs_path: str) -> int:
+    """
+    FunctionStage functor that replaces identical static assets (CSS, JS, images, fonts) across the
+    docs space with hardlinks to a single copy.
+
+    Candidates are grouped by size first, so only files which could be duplicates are hashed. Run this
+    after precompress_docs so that the compressed copies of shared assets get linked too.
+
+    :param logger:
+    :param event_queue:
+    :param docs_path: Root of the docs space
+    :return: return code
+    """
+    by_size = {}
+    for path in _walk_files(docs_path, SHARED_EXTENSIONS):
+        st = os.lstat(path)
+        if st.st_size > 0 and not os.path.islink(path):
+            by_size.setdefault(st.st_size, []).append((path, st))
+
+    candidates = [group for group in by_size.values() if len(group) > 1]
+    linked_files = 0
+    saved_bytes = 0
+    for index, group in enumerate(candidates):
+        by_digest = {}
+        for path, st in group:
+            by_digest.setdefault(file_digest(path), []).append((path, st))
+        for duplicates in by_digest.values():
+            original, original_st = duplicates[0]
+            for path, st in duplicates[1:]:
+                if (st.st_dev, st.st_ino) == (original_st.st_dev, original_st.st_ino):
+                    continue
+                tmp_path = path + ".dedupe-tmp"
+                try:
+                    os.link(original, tmp_path)
+                except OSError as ex:
+                    # Different filesystem, or links not supported; keep the copy.
+                    logger.err("Could not link %s to %s: %s" % (path, original, ex))
+                    continue
+                os.replace(tmp_path, path)
+                linked_files += 1
+                saved_bytes += st.st_size
+        _progress(logger, event_queue, index, len(candidates))
+
+    with open(os.path.join(docs_path, DEDUPE_MARKER), "w") as f:
+        f.write("%d\n" % linked_files)
+
+    logger.out("Linked %d duplicate static files, saving %.1f MiB." % (linked_files, saved_bytes / float(1 << 20)))
+    return 0
+
+
+def release_shared_assets(logger, event_queue, docs_path: str) -> int:
+    """
+    FunctionStage functor that removes hardlinked files from a package's docs, so that the doc generators
+    about to run write fresh files rather than overwriting the copy shared with other packages.
+
+    :param logger:
+    :param event_queue:
+    :param docs_path: Package directory in the docs space
+    :return: return code
+    """
+    for path in _walk_files(docs_path, SHARED_EXTENSIONS):
+        # A package's standalone builder jobs release their own output directories at the same time.
+        try:
+            if os.lstat(path).st_nlink > 1:
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+    return 0
+
+
+def release_summary_assets(logger, event_queue, docs_space: str) -> int:
+    """
+    FunctionStage functor that gives the summary's own files in the docs space, eg, its _static
+    directory, private copies of any which are hardlinked to other packages' assets, so that the
+    summary's Sphinx build doesn't write through the links. Unlike release_shared_assets, the files
+    are copied rather than removed, since Sphinx doesn't rewrite everything it wrote before. Package
+    directories are left to their jobs.
+
+    :param logger:
+    :param event_queue:
+    :param docs_space: Root of the docs space
+    :return: return code
+    """
+    released = 0
+    for name in sorted(os.listdir(docs_space)):
+        path = os.path.join(docs_space, name)
+        if os.path.isdir(path) and is_package_docs(path):
+            continue
+        paths = _walk_files(path, SHARED_EXTENSIONS) if os.path.isdir(path) else [path]
+        for file_path in paths:
+            if file_path.endswith(SHARED_EXTENSIONS) and os.lstat(file_path).st_nlink > 1:
+                tmp_path = file_path + ".tmp"
+                shutil.copy2(file_path, tmp_path)
+                os.replace(tmp_path, file_path)
+                released += 1
+    logger.out("Copied %d shared static files before the summary build." % released)
+    return 0
+
+
+def _compress(path: str, fmt: str) -> bool:
+    dest_path = "%s.%s" % (path, fmt)
+    try:
+        if os.stat(dest_path).st_mtime >= os.stat(path).st_mtime:
+            return False
+    except OSError:
+        pass
+
+    with open(path, "rb") as f:
+        data = f.read()
+    if fmt == "gz":
+        # Fixed mtime so that unchanged inputs produce byte-identical outputs.
+        data = gzip.compress(data, compresslevel=9, mtime=0)
+    else:
+        data = brotli.compress(data)
+
+    with open(dest_path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(dest_path + ".tmp", dest_path)
+    return True
+
+
+def precompress_docs(logger, event_queue, docs_path: str, formats: List[str], jobs: int = 4) -> int:
+    """
+    FunctionStage functor that writes pre-compressed siblings (foo.html.gz, foo.html.br) of the text
+    files in the docs space, for static hosting. Files are only recompressed when they are newer than
+    their existing compressed sibling.
+
+    :param logger:
+    :param event_queue:
+    :param docs_path: Root of the docs space
+    :param formats: Compression formats to write, from COMPRESSION_FORMATS
+    :param jobs: Number of files to compress in parallel
+    :return: return code
+    """
+    if "br" in formats and brotli is None:
+        logger.err("The brotli module is not installed, skipping .br output.")
+        formats = [fmt for fmt in formats if fmt != "br"]
+
+    paths = list(_walk_files(docs_path, COMPRESSIBLE_EXTENSIONS))
+    written = 0
+    # Imported here, as this module is loaded along with the verb's arguments.
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for fmt in formats:
+            for index, result in enumerate(pool.map(lambda path: _compress(path, fmt), paths)):
+                written += result
+                if index % 1000 == 0:
+                    _progress(logger, event_queue, index, len(paths))
+
+    logger.out("Compressed %d of %d files." % (written, len(paths) * len(formats)))
+    return 0
@@ -12,21 +12,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from functools import lru_cache
+
 import os
 
+from catkin_tools.common import log
 from catkin_tools.execution.stages import CommandStage
 from catkin_tools.execution.stages import FunctionStage
 from catkin_tools.jobs.utils import makedirs
+from catkin_tools.terminal_color import fmt
 
 from .doxygen import generate_doxygen_config, generate_doxygen_config_tags, filter_doxygen_tags
+from .doxygen import generate_doxygen_inventory
 from .intersphinx import generate_intersphinx_mapping
+from .openapi import write_openapi_page
+from .pyast import generate_python_api
+from .pyworker import run_pydoctor
 from .util import output_dir_file
 from .util import unset_env
-from .util import which
 from .util import write_file
 
 
-def doxygen(conf, package, deps, doc_deps, output_path, source_path, docs_build_path, job_env):
+def doxygen(conf, package, deps, doc_deps, output_path, source_path, docs_build_path, job_env, toolchain):
     # We run doxygen twice, once to generate the actual docs, and then a second time to generate
     # the tagfiles to link this documentation from other docs. See the following SO discussion
     # for this suggestion: http://stackoverflow.com/a/35640905/109517
@@ -41,7 +48,9 @@ def doxygen(conf, package, deps, doc_deps, output_path, source_path, docs_build_
             source_path=source_path,
             docs_build_path=docs_build_path,
         ),
-        CommandStage("rosdoc_doxygen", [which("doxygen"), os.path.join(docs_build_path, "Doxyfile")], cwd=source_path),
+        CommandStage(
+            "rosdoc_doxygen", [toolchain.path("doxygen"), os.path.join(docs_build_path, "Doxyfile")], cwd=source_path
+        ),
         FunctionStage(
             "generate_doxygen_config_tags",
             generate_doxygen_config_tags,
@@ -52,29 +61,46 @@ def doxygen(conf, package, deps, doc_deps, output_path, source_path, docs_build_
             docs_build_path=docs_build_path,
         ),
         CommandStage(
-            "rosdoc_doxygen_tags", [which("doxygen"), os.path.join(docs_build_path, "Doxyfile_tags")], cwd=source_path
+            "rosdoc_doxygen_tags",
+            [toolchain.path("doxygen"), os.path.join(docs_build_path, "Doxyfile_tags")],
+            cwd=source_path,
         ),
         # Filter the tags XML to remove user-defined references that may appear in multiple
         # packages (like "codeapi"), since they are not namespaced.
         FunctionStage("filter_doxygen_tags", filter_doxygen_tags, docs_build_path=docs_build_path),
+        # Reuse the XML output for Sphinx packages to link against, and for the search index.
+        FunctionStage(
+            "generate_doxygen_inventory",
+            generate_doxygen_inventory,
+            package=package,
+            output_path=output_path,
+            docs_build_path=docs_build_path,
+        ),
     ]
 
 
-def sphinx(conf, package, deps, doc_deps, output_path, source_path, docs_build_path, job_env):
-    root_dir = os.path.join(source_path, conf.get("sphinx_root_dir", "."))
-    output_dir = os.path.join(output_path, "html", conf.get("output_dir", ""))
-
-    rpp = os.environ["ROS_PACKAGE_PATH"].split(":")
-    rpp.insert(0, source_path)
-    if os.path.isdir(os.path.join(source_path, "src")):
-        rpp.insert(0, os.path.join(source_path, "src"))
-    env = {
+@lru_cache(maxsize=None)
+def _base_sphinx_env():
+    """Environment of the run which every sphinx-build gets, read once for all the packages."""
+    return {
         "PATH": os.environ.get("PATH", ""),
         "PYTHONPATH": os.environ.get("PYTHONPATH", ""),
-        "ROS_PACKAGE_PATH": ":".join(rpp),
+        "ROS_PACKAGE_PATH": os.environ["ROS_PACKAGE_PATH"],
         "LD_LIBRARY_PATH": os.environ.get("LD_LIBRARY_PATH", ""),
     }
 
+
+def sphinx(conf, package, deps, doc_deps, output_path, source_path, docs_build_path, job_env, toolchain):
+    root_dir = os.path.join(source_path, conf.get("sphinx_root_dir", "."))
+    output_dir = os.path.join(output_path, "html", conf.get("output_dir", ""))
+
+    # The package's own paths go in front of the run's ROS_PACKAGE_PATH, which is passed on as is.
+    base_env = _base_sphinx_env()
+    package_paths = [source_path]
+    if os.path.isdir(os.path.join(source_path, "src")):
+        package_paths.insert(0, os.path.join(source_path, "src"))
+    env = dict(base_env, ROS_PACKAGE_PATH=":".join(package_paths + [base_env["ROS_PACKAGE_PATH"]]))
+
     return [
         FunctionStage(
             "cache_sphinx_output",
@@ -90,13 +116,22 @@ def sphinx(conf, package, deps, doc_deps, output_path, source_path, docs_build_p
             doc_deps=doc_deps,
             docs_build_path=docs_build_path,
             job_env=job_env,
+            inline=conf.get("inline_intersphinx_mapping", False),
+        ),
+        CommandStage(
+            "rosdoc_sphinx", [toolchain.path("sphinx-build"), "-E", root_dir, output_dir], cwd=root_dir, env=env
+        ),
+        FunctionStage(
+            "job_env_unset_intersphinx_mapping",
+            unset_env,
+            job_env=job_env,
+            keys=["INTERSPHINX_MAPPING_FILE"]
+            + (["INTERSPHINX_MAPPING"] if conf.get("inline_intersphinx_mapping", False) else []),
         ),
-        CommandStage("rosdoc_sphinx", [which("sphinx-build"), "-E", root_dir, output_dir], cwd=root_dir, env=env),
-        FunctionStage("job_env_unset_intersphinx_mapping", unset_env, job_env=job_env, keys=["INTERSPHINX_MAPPING"]),
     ]
 
 
-def pydoctor(conf, package, deps, doc_deps, output_path, source_path, docs_build_path, job_env):
+def pydoctor(conf, package, deps, doc_deps, output_path, source_path, docs_build_path, job_env, toolchain):
     output_dir = os.path.join(output_path, "html", conf.get("output_dir", ""))
 
     # TODO: Would be better to extract this information from the setup.py, but easier
@@ -105,16 +140,13 @@ def pydoctor(conf, package, deps, doc_deps, output_path, source_path, docs_build
     if not os.path.isdir(src_dir):
         src_dir = os.path.join(source_path, "src")
 
-    command = [which("pydoctor"), "--project-name", package.name, "--html-output", output_dir]
+    args = ["--project-name", package.name, "--html-output", output_dir]
 
     if "config" in conf and "epydoc" not in conf["config"]:
-        command.extend(["--config", os.path.join(source_path, conf["config"])])
+        args.extend(["--config", os.path.join(source_path, conf["config"])])
 
     for subdir in os.listdir(src_dir):
-        command.append(os.path.join(src_dir, subdir))
-
-    # pydoctor returns error codes for minor issues we don't care about.
-    wrapper_command = ["/bin/bash", "-c", "%s || true" % " ".join(command)]
+        args.append(os.path.join(src_dir, subdir))
 
     return [
         FunctionStage("mkdir_pydoctor", makedirs, path=output_dir),
@@ -124,15 +156,43 @@ def pydoctor(conf, package, deps, doc_deps, output_path, source_path, docs_build
             contents=output_dir,
             dest_path=os.path.join(docs_build_path, output_dir_file("pydoctor")),
         ),
-        CommandStage("rosdoc_pydoctor", wrapper_command, cwd=src_dir),
+        # Runs on a persistent worker rather than a fresh pydoctor process per package.
+        FunctionStage("rosdoc_pydoctor", run_pydoctor, args=args, cwd=src_dir, output_dir=output_dir),
+    ]
+
+
+def pyast(conf, package, deps, doc_deps, output_path, source_path, docs_build_path, job_env, toolchain):
+    output_dir = os.path.join(output_path, "html", conf.get("output_dir", ""))
+
+    # Same source layout assumption as pydoctor, unless configured.
+    src_dir = os.path.join(source_path, conf.get("source_dir", "python"))
+    if "source_dir" not in conf and not os.path.isdir(src_dir):
+        src_dir = os.path.join(source_path, "src")
+
+    return [
+        FunctionStage(
+            "cache_pyast_output",
+            write_file,
+            contents=output_dir,
+            dest_path=os.path.join(docs_build_path, output_dir_file("pyast")),
+        ),
+        FunctionStage(
+            "rosdoc_pyast",
+            generate_python_api,
+            package_name=package.name,
+            src_dir=src_dir,
+            output_dir=output_dir,
+            cache_dir=os.path.join(docs_build_path, "pyast_cache"),
+            include_private=conf.get("include_private", False),
+        ),
     ]
 
 
-def epydoc(conf, package, deps, doc_deps, output_path, source_path, docs_build_path, job_env):
-    epydoc_exe = which("epydoc")
+def epydoc(conf, package, deps, doc_deps, output_path, source_path, docs_build_path, job_env, toolchain):
+    epydoc_exe = toolchain.path("epydoc")
     if epydoc_exe is None:
         # If epydoc is missing, fall back to pydoctor.
-        return pydoctor(conf, package, deps, doc_deps, output_path, source_path, docs_build_path, job_env)
+        return pydoctor(conf, package, deps, doc_deps, output_path, source_path, docs_build_path, job_env, toolchain)
 
     output_dir = os.path.join(output_path, "html", conf.get("output_dir", ""))
 
@@ -148,18 +208,162 @@ def epydoc(conf, package, deps, doc_deps, output_path, source_path, docs_build_p
 
     env = {"PYTHONPATH": os.environ.get("PYTHONPATH", ""), "LD_LIBRARY_PATH": os.environ.get("LD_LIBRARY_PATH", "")}
 
-    # Swallow errors from epydoc until we figure out a better story for Python 3.
-    wrapper_command = ["/bin/bash", "-c", "%s || true" % " ".join(command)]
-
     return [
         FunctionStage("mkdir_epydoc", makedirs, path=output_dir),
-        CommandStage("rosdoc_epydoc", wrapper_command, cwd=source_path, env=env),
+        CommandStage("rosdoc_epydoc", command, cwd=source_path, env=env),
+    ]
+
+
+def jsdoc(conf, package, deps, doc_deps, output_path, source_path, docs_build_path, job_env, toolchain):
+    jsdoc_exe = toolchain.path("jsdoc")
+    if jsdoc_exe is None:
+        log(fmt("[document] @!@{yf}Warning:@| jsdoc is not installed, skipping JavaScript docs of [%s]" % package.name))
+        return []
+
+    output_dir = os.path.join(output_path, "html", conf.get("output_dir", "js"))
+    command = [
+        jsdoc_exe,
+        "--recurse",
+        os.path.join(source_path, conf.get("source_dir", "js")),
+        "--destination",
+        output_dir,
+    ]
+    if "config" in conf:
+        command.extend(["--configure", os.path.join(source_path, conf["config"])])
+    readme_path = os.path.join(source_path, "README.md")
+    if os.path.isfile(readme_path):
+        command.extend(["--readme", readme_path])
+
+    return [
+        FunctionStage("mkdir_jsdoc", makedirs, path=output_dir),
+        FunctionStage(
+            "cache_jsdoc_output",
+            write_file,
+            contents=output_dir,
+            dest_path=os.path.join(docs_build_path, output_dir_file("jsdoc")),
+        ),
+        CommandStage("rosdoc_jsdoc", command, cwd=source_path),
     ]
 
 
-def jsdoc():
-    raise NotImplementedError
+def openapi(conf, package, deps, doc_deps, output_path, source_path, docs_build_path, job_env, toolchain):
+    output_dir = os.path.join(output_path, "html", conf.get("output_dir", "openapi"))
+    spec_path = os.path.join(source_path, conf.get("spec", "openapi.yaml"))
+
+    redocly_exe = toolchain.path("redocly")
+    if redocly_exe is not None:
+        render_stage = CommandStage(
+            "rosdoc_openapi",
+            [redocly_exe, "build-docs", spec_path, "--output", os.path.join(output_dir, "index.html")],
+            cwd=source_path,
+        )
+    else:
+        # Without the Redocly CLI, publish the spec with a page which renders it client-side.
+        render_stage = FunctionStage(
+            "rosdoc_openapi", write_openapi_page, spec_path=spec_path, output_dir=output_dir, title=package.name
+        )
+
+    return [
+        FunctionStage("mkdir_openapi", makedirs, path=output_dir),
+        FunctionStage(
+            "cache_openapi_output",
+            write_file,
+            contents=output_dir,
+            dest_path=os.path.join(docs_build_path, output_dir_file("openapi")),
+        ),
+        render_stage,
+    ]
+
+
+# Descriptions of the builders above, registered as entry points, see registry.BUILDERS_GROUP.
+
+doxygen_description = dict(
+    create_stages=doxygen,
+    defaults=dict(output_dir=""),
+    inputs=["{source_path}/**"],
+    outputs=["{docs_path}/html/{output_dir}"],
+    inventories={"doxygen_tags": "{docs_build_path}/tags", "objects.inv": "{docs_path}/html/{output_dir}/objects.inv"},
+    schema=dict(
+        aliases=str,
+        example_patterns=str,
+        exclude_patterns=str,
+        exclude_symbols=str,
+        file_patterns=str,
+        image_path=str,
+        tab_size=(int, str),
+        use_mdfile_as_mainpage=str,
+    ),
+    tools=["doxygen"],
+    optional_tools=["dot"],
+    cost=10,
+)
+
+sphinx_description = dict(
+    create_stages=sphinx,
+    defaults=dict(output_dir="", sphinx_root_dir=".", inline_intersphinx_mapping=False),
+    inputs=["{source_path}/{sphinx_root_dir}/**", "{source_path}/src/**/*.py", "{source_path}/python/**/*.py"],
+    outputs=["{docs_path}/html/{output_dir}"],
+    inventories={"objects.inv": "{docs_path}/html/{output_dir}/objects.inv"},
+    schema=dict(sphinx_root_dir=str, inline_intersphinx_mapping=bool),
+    tools=["sphinx-build"],
+    cost=5,
+)
+
+pydoctor_description = dict(
+    create_stages=pydoctor,
+    defaults=dict(output_dir=""),
+    inputs=["{source_path}/python/**/*.py", "{source_path}/src/**/*.py"],
+    outputs=["{docs_path}/html/{output_dir}"],
+    inventories={"objects.inv": "{docs_path}/html/{output_dir}/objects.inv"},
+    schema=dict(config=str),
+    tools=["pydoctor"],
+    cost=3,
+)
+
+pyast_description = dict(
+    create_stages=pyast,
+    defaults=dict(output_dir=""),
+    inputs=["{source_path}/python/**/*.py", "{source_path}/src/**/*.py"],
+    outputs=["{docs_path}/html/{output_dir}"],
+    inventories={"objects.inv": "{docs_path}/html/{output_dir}/objects.inv"},
+    schema=dict(source_dir=str, include_private=bool),
+    cost=1,
+)
+
+epydoc_description = dict(
+    create_stages=epydoc,
+    defaults=dict(output_dir=""),
+    inputs=["{source_path}/python/**/*.py", "{source_path}/src/**/*.py"],
+    outputs=["{docs_path}/html/{output_dir}"],
+    inventories={},
+    schema=dict(config=str, exclude=list),
+    # Falls back to pydoctor without epydoc.
+    tools=[("epydoc", "pydoctor")],
+    cost=3,
+)
 
+jsdoc_description = dict(
+    create_stages=jsdoc,
+    # Standalone builders run alongside the package's job, so they get a directory of their own.
+    defaults=dict(output_dir="js", source_dir="js", config=""),
+    inputs=["{source_path}/{source_dir}/**/*.js", "{source_path}/{source_dir}/**/*.mjs", "{source_path}/README.md"],
+    outputs=["{docs_path}/html/{output_dir}"],
+    inventories={},
+    schema=dict(source_dir=str, config=str),
+    optional_tools=["jsdoc"],
+    cost=2,
+    standalone=True,
+)
 
-def swagger():
-    raise NotImplementedError
+openapi_description = dict(
+    name="openapi",
+    create_stages=openapi,
+    defaults=dict(output_dir="openapi", spec="openapi.yaml"),
+    inputs=["{source_path}/{spec}"],
+    outputs=["{docs_path}/html/{output_dir}"],
+    inventories={},
+    schema=dict(spec=str),
+    optional_tools=["redocly"],
+    cost=1,
+    standalone=True,
+)
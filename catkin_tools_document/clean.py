@@ -0,0 +1,132 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+
+from catkin_pkg.packages import find_packages
+
+from catkin_tools.common import log
+from catkin_tools.terminal_color import fmt
+
+from .config import RosdocConfigError
+from .document import load_rosdoc_conf
+from .doxygen import DOXYGEN_SYMBOLS_FILE
+from .manifest import stale_package_paths
+from .registry import builder_name
+from .registry import load_builders
+from .util import input_fingerprint_file
+from .util import output_dir_file
+
+# Files of a package's docs build space which only the doxygen builder writes. A leftover tags
+# file would keep other packages linking to API docs which are no longer generated.
+DOXYGEN_BUILD_FILES = ("Doxyfile", "Doxyfile_tags", "tags", DOXYGEN_SYMBOLS_FILE)
+
+
+def _is_within(path, parent):
+    path = os.path.realpath(path)
+    parent = os.path.realpath(parent)
+    return path == parent or path.startswith(parent.rstrip(os.sep) + os.sep)
+
+
+def _stale_builder_outputs(docs_space, docs_build_space, rosdoc_conf):
+    """Output markers, output directories and build files of builders the package no longer uses."""
+    builders = load_builders()
+    live_builders = set(builder_name(conf.get("builder"), builders) for conf in rosdoc_conf)
+    live_output_dirs = [os.path.join(docs_space, "html", conf.get("output_dir", "")) for conf in rosdoc_conf]
+
+    stale = []
+    for builder in sorted(set(builder_name(name, builders) for name in builders)):
+        if builder in live_builders:
+            continue
+        fingerprint_path = os.path.join(docs_build_space, input_fingerprint_file(builder))
+        if os.path.isfile(fingerprint_path):
+            stale.append(fingerprint_path)
+        marker_path = os.path.join(docs_build_space, output_dir_file(builder))
+        if not os.path.isfile(marker_path):
+            continue
+        stale.append(marker_path)
+        with open(marker_path) as f:
+            output_dir = f.read().strip()
+        # Keep directories which a current builder also writes to, or which hold one.
+        if (
+            output_dir
+            and os.path.isdir(output_dir)
+            and _is_within(output_dir, os.path.join(docs_space, "html"))
+            and not any(_is_within(d, output_dir) or _is_within(output_dir, d) for d in live_output_dirs)
+        ):
+            stale.append(output_dir)
+
+    if "doxygen" not in live_builders:
+        stale.extend(
+            os.path.join(docs_build_space, name)
+            for name in DOXYGEN_BUILD_FILES
+            if os.path.isfile(os.path.join(docs_build_space, name))
+        )
+    return stale
+
+
+def find_stale_docs(context, workspace_packages):
+    """Paths in the docs and docs build spaces which the current workspace wouldn't produce.
+
+    The live set is computed from the workspace's packages and their rosdoc configurations: the
+    directories of packages which were removed or renamed, and the outputs of builders which a
+    package no longer uses, are stale. Like the summary's pruning, only directories which a package
+    job wrote a manifest in are considered, see manifest.stale_package_paths, so anything else in the
+    docs space is left alone.
+    """
+    docs_space = context.docs_space_abs
+    docs_build_space = os.path.join(context.build_space_abs, "docs")
+    live_packages = dict((pkg.name, (path, pkg)) for path, pkg in workspace_packages.items())
+
+    stale = []
+    for _, paths in sorted(stale_package_paths(docs_space, docs_build_space, live_packages).items()):
+        stale.extend(paths)
+
+    for name, (path, pkg) in sorted(live_packages.items()):
+        try:
+            rosdoc_conf = load_rosdoc_conf(pkg, os.path.join(context.source_space_abs, path))
+        except RosdocConfigError as ex:
+            # Without knowing which builders the package uses, none of its outputs can be called stale.
+            log(fmt("[document] @!@{yf}Warning:@| Not cleaning package [%s]: %s" % (name, ex)))
+            continue
+        stale.extend(
+            _stale_builder_outputs(
+                os.path.join(docs_space, name), os.path.join(docs_build_space, name), rosdoc_conf or []
+            )
+        )
+    return stale
+
+
+def clean_docs(context, workspace_packages=None, dry_run=False):
+    """Remove orphaned outputs from the docs and docs build spaces, see find_stale_docs.
+
+    :returns: The removed (or, for a dry run, the stale) paths
+    """
+    if workspace_packages is None:
+        workspace_packages = find_packages(context.source_space_abs, exclude_subspaces=True, warnings=[])
+
+    stale = find_stale_docs(context, workspace_packages)
+    for path in stale:
+        log(fmt("[document] %s @{cf}%s@|" % ("Would remove" if dry_run else "Removing", path)))
+        if dry_run or not os.path.lexists(path):
+            continue
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.unlink(path)
+
+    if not stale:
+        log(fmt("[document] Nothing to clean."))
+    return stale
@@ -13,19 +13,34 @@
 # limitations under the License.
 
 from argparse import ArgumentTypeError
-
-from catkin_pkg.package import InvalidPackage
+import os
+import sys
 
 from catkin_tools.argument_parsing import add_context_args
-from catkin_tools.common import find_enclosing_package, getcwd
-from catkin_tools.context import Context
-from catkin_tools.execution import job_server
-from catkin_tools.metadata import find_enclosing_workspace
 
-from .document import document_workspace
+# Only what declaring the arguments needs is imported up front: the verb is loaded whenever catkin
+# runs, eg, for `catkin --help` or for another verb, so main imports the rest once a run starts.
+from .assets import COMPRESSION_FORMATS
+from .memory import memory_size_type
+from .shard import shard_count_type
+from .shard import shard_type
 
 
 def main(opts):
+    from catkin_pkg.package import InvalidPackage
+
+    from catkin_tools.common import find_enclosing_package, getcwd
+    from catkin_tools.context import Context
+    from catkin_tools.execution import job_server
+    from catkin_tools.metadata import find_enclosing_workspace
+    from catkin_tools.terminal_color import fmt
+
+    from .clean import clean_docs
+    from .document import document_workspace
+    from .serve import serve_workspace
+    from .shard import run_local_shards
+    from .watch import watch_workspace
+
     ctx = Context.load(opts.workspace, opts.profile, opts, append=True)
 
     # Context-aware args
@@ -39,7 +54,7 @@ def main(opts):
             this_package = find_enclosing_package(search_start_path=getcwd(), ws_path=ws_path, warnings=[])
         except InvalidPackage as ex:
             sys.exit(
-                clr(
+                fmt(
                     "@{rf}Error:@| The file %s is an invalid package.xml file."
                     " See below for details:\n\n%s" % (ex.package_path, ex.msg)
                 )
@@ -65,9 +80,12 @@ def main(opts):
 
     job_server.initialize(max_jobs=4, max_load=None, gnu_make_enabled=False)
 
-    return document_workspace(
-        ctx,
-        packages=opts.packages,
+    # Archives default to a sibling of the docs space, so they aren't swept up into it.
+    archive_dir = None
+    if opts.archive is not None:
+        archive_dir = os.path.abspath(opts.archive or ctx.docs_space_abs.rstrip(os.sep) + "_archive")
+
+    document_kwargs = dict(
         start_with=opts.start_with,
         no_deps=opts.no_deps,
         n_jobs=int(opts.parallel_jobs or 4),
@@ -79,6 +97,36 @@ def main(opts):
         no_notify=opts.no_notify,
         continue_on_failure=opts.continue_on_failure,
         summarize_build=opts.summarize,
+        dedupe_assets=opts.dedupe_assets,
+        precompress=opts.precompress,
+        archive_dir=archive_dir,
+        mem_limit_kb=opts.mem_limit,
+        event_log_path=opts.event_log and os.path.abspath(opts.event_log),
+        stage_timeout=opts.stage_timeout,
+        stall_timeout=opts.stall_timeout,
+        fast_summary=opts.fast_summary,
+        check_links=opts.check_links,
+    )
+
+    if opts.clean or opts.clean_only:
+        clean_docs(ctx, dry_run=opts.dry_run)
+        if opts.clean_only or opts.dry_run:
+            return 0
+
+    if opts.serve:
+        return serve_workspace(ctx, host=opts.serve_host, port=opts.serve_port, **document_kwargs)
+
+    if opts.watch:
+        return watch_workspace(ctx, packages=opts.packages, interval=opts.watch_interval, **document_kwargs)
+
+    if opts.local_shards:
+        return run_local_shards(
+            opts.local_shards,
+            lambda: document_workspace(ctx, packages=opts.packages, merge_shards=True, **document_kwargs),
+        )
+
+    return document_workspace(
+        ctx, packages=opts.packages, shard=opts.shard, merge_shards=opts.merge_shards, **document_kwargs
     )
 
 
@@ -124,6 +172,15 @@ def prepare_arguments(parser):
         help="Maximum number of packages allowed to be built in parallel (default is cpu count)",
     )
 
+    add(
+        "--mem-limit",
+        type=memory_size_type,
+        default=None,
+        metavar="SIZE",
+        help="Only start packages while the sum of their expected peak memory use, as observed in previous runs, "
+        "fits under SIZE (eg, 16G). Concurrency is reduced rather than exceeding the limit.",
+    )
+
     start_with_group = pkg_group.add_mutually_exclusive_group()
     add = start_with_group.add_argument
     add(
@@ -149,6 +206,29 @@ def prepare_arguments(parser):
         "packages fail to document.",
     )
 
+    def seconds_type(seconds):
+        seconds = float(seconds)
+        if seconds <= 0:
+            raise ArgumentTypeError("must be greater than zero.")
+        return seconds
+
+    add(
+        "--stage-timeout",
+        type=seconds_type,
+        default=None,
+        metavar="SECONDS",
+        help="Kill documentation commands (doxygen, sphinx, ...) which run for longer than SECONDS, failing their "
+        "package. Overridden per builder by a timeout key in rosdoc.yaml.",
+    )
+    add(
+        "--stall-timeout",
+        type=seconds_type,
+        default=None,
+        metavar="SECONDS",
+        help="Kill documentation commands which go SECONDS without printing anything, failing their package. "
+        "Overridden per builder by a stall_timeout key in rosdoc.yaml.",
+    )
+
     behavior_group = parser.add_argument_group("Interface", "The behavior of the command-line interface.")
     add = behavior_group.add_argument
     add(
@@ -202,5 +282,127 @@ def prepare_arguments(parser):
         "Must be positive, default is 10 Hz.",
     )
     add("--no-notify", action="store_true", default=False, help="Suppresses system pop-up notification.")
+    add(
+        "--event-log",
+        metavar="PATH",
+        default=None,
+        help="Append every execution event of the run (jobs queued, started and finished, stage progress, durations, "
+        "exit codes, bytes written) to PATH as newline-delimited JSON, as it happens.",
+    )
+
+    clean_group = parser.add_argument_group(
+        "Clean", "Remove outputs which the current workspace no longer produces from the docs and build spaces."
+    )
+    add = clean_group.add_mutually_exclusive_group().add_argument
+    add(
+        "--clean",
+        action="store_true",
+        default=False,
+        help="Before documenting, remove the docs of packages which are no longer in the workspace, and the outputs "
+        "of builders which packages no longer use.",
+    )
+    add("--clean-only", action="store_true", default=False, help="Like --clean, but don't document afterwards.")
+    add = clean_group.add_argument
+    add(
+        "--dry-run",
+        action="store_true",
+        default=False,
+        help="With --clean or --clean-only, only list what would be removed.",
+    )
+
+    output_group = parser.add_argument_group("Output", "Post-processing of the docs space for publishing.")
+    add = output_group.add_argument
+    add(
+        "--dedupe-assets",
+        action="store_true",
+        default=False,
+        help="Replace identical static assets (CSS, JS, images, fonts) across packages with hardlinks.",
+    )
+    add(
+        "--precompress",
+        action="append",
+        choices=COMPRESSION_FORMATS,
+        default=None,
+        help="Write pre-compressed copies of HTML, JS and CSS files next to the originals for static hosting. "
+        "May be given more than once; br requires the brotli module.",
+    )
+
+    add(
+        "--fast-summary",
+        action="store_true",
+        default=False,
+        help="Render the package summary, message and service pages straight to HTML as each package is documented, "
+        "rather than with a Sphinx build over the whole workspace at the end. Sphinx is still used by packages which "
+        "configure it in rosdoc.yaml.",
+    )
+    add(
+        "--check-links",
+        action="store_true",
+        default=False,
+        help="Once the summary is written, check every relative link and anchor in the docs space, including those "
+        "between packages, and report the broken ones by package. The full list is written to broken_links.json in "
+        "the docs build space.",
+    )
+    add(
+        "--archive",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="DIR",
+        help="Also pack each package's generated docs into DIR/<package>.zip as it completes, and the summary pages "
+        "into DIR/_summary.zip, for publishing and for --serve. DIR defaults to a sibling of the docs space.",
+    )
+
+    shard_group = parser.add_argument_group(
+        "Sharding", "Split documenting a workspace across hosts which share its build and docs spaces."
+    )
+    add = shard_group.add_mutually_exclusive_group().add_argument
+    add(
+        "--shard",
+        type=shard_type,
+        default=None,
+        metavar="I/N",
+        help="Only document the I-th of N equal shares of the packages, waiting for the other shards to document "
+        "the dependencies this one doesn't. The summary is left to --merge-shards.",
+    )
+    add(
+        "--merge-shards",
+        action="store_true",
+        default=False,
+        help="Wait for all the shards to finish, then build the summary over their combined output.",
+    )
+    add(
+        "--local-shards",
+        type=shard_count_type,
+        default=None,
+        metavar="N",
+        help="Run N shards as separate processes on this machine, then merge them.",
+    )
+
+    watch_group = parser.add_argument_group("Watch", "Keep documentation up to date while editing sources.")
+    add = watch_group.add_argument
+    add(
+        "--serve",
+        action="store_true",
+        default=False,
+        help="Serve the docs space over HTTP, documenting each package (and its undocumented dependencies) the "
+        "first time one of its pages is requested.",
+    )
+    add("--serve-host", default="127.0.0.1", metavar="HOST", help="Address for --serve to bind (default: 127.0.0.1).")
+    add("--serve-port", type=int, default=8000, metavar="PORT", help="Port for --serve to listen on (default: 8000).")
+    add(
+        "--watch",
+        action="store_true",
+        default=False,
+        help="After documenting, keep watching the package sources and re-document changed packages and the "
+        "packages which depend on them.",
+    )
+    add(
+        "--watch-interval",
+        type=seconds_type,
+        default=1.0,
+        metavar="SECONDS",
+        help="How often to scan the package sources for changes in --watch mode (default: 1.0).",
+    )
 
     return parser
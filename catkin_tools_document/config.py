@@ -0,0 +1,223 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import hashlib
+import json
+import os
+import threading
+import yaml
+
+from catkin_tools.common import mkdir_p
+
+from .registry import builder_output_dir
+from .registry import load_builders
+from .util import write_if_changed
+
+# Keys which any builder's configuration may have. Builders add their own with a schema in their
+# description, see registry.BUILDERS_GROUP; other keys are left alone, since rosdoc.yaml files
+# written for rosdoc_lite often carry some which no builder here reads.
+COMMON_SCHEMA = dict(
+    builder=str,
+    name=str,
+    output_dir=str,
+    timeout=(int, float),
+    stall_timeout=(int, float),
+    inputs=list,
+)
+
+# Bump when validation changes, to invalidate cached results.
+_SCHEMA_VERSION = 2
+
+_SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Validated configurations by content hash, shared by everything which loads them during a run.
+_compiled = {}
+_compiled_lock = threading.Lock()
+_compiled_changed = False
+# Hashes of the configurations loaded during this run; only those are kept in the cache file.
+_used = set()
+
+
+class RosdocConfigError(Exception):
+    """A rosdoc.yaml which can't be parsed or doesn't match the schema."""
+
+    def __init__(self, path, errors):
+        super(RosdocConfigError, self).__init__("%s: %s" % (path, "; ".join(errors)))
+        self.path = path
+        self.errors = errors
+
+
+def config_cache_path(context):
+    return os.path.join(context.build_space_abs, "docs", ".rosdoc_cache.json")
+
+
+def _type_names(types):
+    return " or ".join(t.__name__ for t in types)
+
+
+def validate_rosdoc_conf(rosdoc_conf, builders):
+    """Check a parsed rosdoc.yaml against the common and builder schemas.
+
+    :param rosdoc_conf: Parsed contents of a rosdoc.yaml
+    :param builders: Registered builder descriptions, see registry.load_builders
+    :returns: A description of each problem found
+    """
+    if not isinstance(rosdoc_conf, list):
+        return ["expected a list of builder configurations, got %s" % type(rosdoc_conf).__name__]
+
+    errors = []
+    for index, conf in enumerate(rosdoc_conf):
+        where = "entry %d" % (index + 1)
+        if not isinstance(conf, dict):
+            errors.append("%s: expected a mapping, got %s" % (where, type(conf).__name__))
+            continue
+        if "builder" not in conf:
+            errors.append("%s: missing builder" % where)
+            continue
+
+        schema = dict(COMMON_SCHEMA)
+        if isinstance(conf["builder"], str):
+            where = "entry %d (%s)" % (index + 1, conf["builder"])
+            schema.update(builders.get(conf["builder"], {}).get("schema", {}))
+        for key, value in sorted(conf.items()):
+            types = schema.get(key)
+            if types is None:
+                continue
+            types = types if isinstance(types, tuple) else (types,)
+            # YAML booleans are ints to isinstance, but never what a number key means.
+            if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+                errors.append("%s: %s must be %s, got %s" % (where, key, _type_names(types), type(value).__name__))
+        for key in ("timeout", "stall_timeout"):
+            if isinstance(conf.get(key), (int, float)) and conf[key] <= 0:
+                errors.append("%s: %s must be greater than zero" % (where, key))
+        if isinstance(conf.get("inputs"), list) and not all(isinstance(p, str) for p in conf["inputs"]):
+            errors.append("%s: inputs must be a list of strings" % where)
+
+    # Standalone builders run at the same time as the package's other builders, so they would clobber
+    # each other's output in a shared directory.
+    output_dirs = {}
+    for index, conf in enumerate(rosdoc_conf):
+        if isinstance(conf, dict) and isinstance(conf.get("builder"), str):
+            output_dir = builder_output_dir(conf, builders)
+            if isinstance(output_dir, str):
+                output_dirs.setdefault(os.path.normpath(output_dir), []).append(
+                    (index, conf["builder"], builders.get(conf["builder"], {}))
+                )
+    for output_dir, users in sorted(output_dirs.items()):
+        if len(users) > 1 and any(description.get("standalone") for _, _, description in users):
+            errors.append(
+                "entries %s (%s) share output_dir %r, which a standalone builder can't share"
+                % (
+                    ", ".join(str(index + 1) for index, _, _ in users),
+                    ", ".join(builder for _, builder, _ in users),
+                    "" if output_dir == "." else output_dir,
+                )
+            )
+    return errors
+
+
+def parse_rosdoc_yaml(contents):
+    """Parse the contents of a rosdoc.yaml, safely: arbitrary tags aren't constructed.
+
+    :returns: (parsed contents, None) or (None, parse error)
+    """
+    try:
+        return yaml.load(contents, Loader=_SafeLoader), None
+    except yaml.YAMLError as ex:
+        return None, str(ex)
+
+
+def _digest(contents):
+    return hashlib.sha256(contents).hexdigest()
+
+
+def _compile(path, contents, parsed, parse_error):
+    global _compiled_changed
+    if parse_error is not None:
+        errors = ["invalid YAML: %s" % parse_error]
+    else:
+        errors = validate_rosdoc_conf(parsed, load_builders())
+    with _compiled_lock:
+        _compiled[_digest(contents)] = dict(conf=parsed if not errors else None, errors=errors)
+        _compiled_changed = True
+    _used.add(_digest(contents))
+    if errors:
+        raise RosdocConfigError(path, errors)
+    return copy.deepcopy(parsed)
+
+
+def read_rosdoc_yaml(path):
+    """Validated contents of a rosdoc.yaml, from the cache of compiled configurations when it's unchanged.
+
+    :raises RosdocConfigError: If the file isn't valid
+    """
+    with open(path, "rb") as f:
+        contents = f.read()
+    digest = _digest(contents)
+    compiled = _compiled.get(digest)
+    if compiled is None:
+        return _compile(path, contents, *parse_rosdoc_yaml(contents))
+    _used.add(digest)
+    if compiled["errors"]:
+        raise RosdocConfigError(path, compiled["errors"])
+    # Callers get their own copy, as the compiled configuration is shared.
+    return copy.deepcopy(compiled["conf"])
+
+
+def validate_rosdoc_yamls(paths):
+    """Validate rosdoc.yaml files up front, parsing those which aren't cached.
+
+    The files are small enough to parse in-process: handing them to the worker pool would cost more
+    in interpreter startup than it saves, and delay reporting the first error.
+
+    :returns: Map of the path of each invalid file to its RosdocConfigError
+    """
+    invalid = {}
+    for path in paths:
+        try:
+            read_rosdoc_yaml(path)
+        except RosdocConfigError as ex:
+            invalid[path] = ex
+    return invalid
+
+
+def _cache_key():
+    # Validation depends on the registered builders' schemas, too.
+    return "%d:%s" % (_SCHEMA_VERSION, ",".join(sorted(load_builders())))
+
+
+def load_config_cache(path):
+    """Load the compiled configurations cached by a previous run, see save_config_cache."""
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return
+    if cache.get("key") == _cache_key():
+        with _compiled_lock:
+            for digest, compiled in cache.get("configs", {}).items():
+                _compiled.setdefault(digest, compiled)
+
+
+def save_config_cache(path):
+    """Persist the compiled configurations used in this run, if any were added since they were loaded."""
+    global _compiled_changed
+    with _compiled_lock:
+        if not _compiled_changed:
+            return
+        cache = dict(key=_cache_key(), configs=dict((d, c) for d, c in _compiled.items() if d in _used))
+        mkdir_p(os.path.dirname(path))
+        write_if_changed(path, json.dumps(cache, sort_keys=True, default=str))
+        _compiled_changed = False
@@ -15,14 +15,6 @@
 import os
 import time
 import traceback
-import yaml
-
-try:
-    # Python3
-    from queue import Queue
-except ImportError:
-    # Python2
-    from Queue import Queue
 
 from catkin_pkg.packages import find_packages
 from catkin_pkg.topological_order import topological_order_packages
@@ -32,7 +24,7 @@ from catkin_tools.common import wide_log
 from catkin_tools.common import get_cached_recursive_build_depends_in_workspace
 
 from catkin_tools.execution.controllers import ConsoleStatusController
-from catkin_tools.execution.executor import execute_jobs
+from catkin_tools.execution.events import ExecutionEvent
 from catkin_tools.execution.executor import run_until_complete
 from catkin_tools.execution.jobs import Job
 from catkin_tools.execution.stages import CommandStage
@@ -44,22 +36,62 @@ from catkin_tools.jobs.utils import makedirs
 from catkin_tools.verbs.catkin_build.build import determine_packages_to_be_built
 from catkin_tools.verbs.catkin_build.build import verify_start_with_option
 
-from . import builders
+from .archive import archive_package_docs
+from .archive import archive_summary_docs
+from .assets import DEDUPE_MARKER
+from .assets import deduplicate_static_assets
+from .assets import precompress_docs
+from .assets import release_shared_assets
+from .assets import release_summary_assets
+from .config import config_cache_path
+from .config import load_config_cache
+from .config import read_rosdoc_yaml
+from .config import save_config_cache
+from .config import validate_rosdoc_yamls
+from .events import EventLogWriter
+from .events import EventQueue
+from .events import FailedDependencyPruner
+from .events import report_dropped_dependencies
+from .fast_summary import render_overall_summary
+from .fast_summary import render_package_summary
+from .history import StageHistory
+from .history import stage_history_path
+from .linkcheck import check_links as check_doc_links
+from .manifest import prune_stale_packages
+from .manifest import write_package_manifest
+from .manifest import write_workspace_manifest
+from .memory import MemoryBudget
+from .memory import predict_peak_rss_kb
+from .monitor import MonitoredIOBufferProtocol
+from .monitor import STAGE_LIMIT_KEYS
+from .registry import builder_cost
+from .registry import builder_name
+from .registry import builder_output_dir
+from .registry import builder_tools
+from .registry import input_fingerprint
+from .registry import load_builders
+from .scheduler import execute_jobs
+from .search import build_search_index
 from .messages import generate_messages
 from .messages import generate_services
 from .messages import generate_package_summary
 from .messages import generate_overall_summary
-from .util import which
+from .shard import ShardAdmission
+from .shard import ShardMarkerWriter
+from .shard import assign_shard
+from .shard import check_shard_packages
+from .shard import clear_shard_markers
+from .shard import shard_markers_path
+from .toolchain import Toolchain
+from .toolchain import toolchain_cache_path
+from .util import input_fingerprint_file
+from .util import output_dir_file
+from .util import write_file
 from .util import yaml_dump_file
 
 
-def create_package_job(context, package, package_path, deps, doc_deps):
-    docs_space = os.path.join(context.docs_space_abs, package.name)
-    docs_build_space = os.path.join(context.build_space_abs, "docs", package.name)
-    package_path_abs = os.path.join(context.source_space_abs, package_path)
-    package_meta_path = context.package_metadata_path(package)
-
-    # Load rosdoc config, if it exists.
+def rosdoc_yaml_path(package, package_path_abs):
+    """The package's rosdoc.yaml, or the config its manifest exports instead, or None if it has neither."""
     rosdoc_yaml_path = os.path.join(package_path_abs, "rosdoc.yaml")
     for export in package.exports:
         if export.tagname == "rosdoc":
@@ -70,10 +102,17 @@ def create_package_job(context, package, package_path, deps, doc_deps):
                     # Stop if configuration is found which exists
                     rosdoc_yaml_path = rosdoc_yaml_path_temp
                     break
+    return rosdoc_yaml_path if os.path.isfile(rosdoc_yaml_path) else None
+
 
-    if os.path.isfile(rosdoc_yaml_path):
-        with open(rosdoc_yaml_path) as f:
-            rosdoc_conf = yaml.full_load(f)
+def load_rosdoc_conf(package, package_path_abs):
+    """The package's list of builder configurations, from its rosdoc.yaml, or the default for its layout.
+
+    :raises RosdocConfigError: If the package's rosdoc.yaml isn't valid
+    """
+    path = rosdoc_yaml_path(package, package_path_abs)
+    if path is not None:
+        rosdoc_conf = read_rosdoc_yaml(path)
     else:
         if os.path.isdir(os.path.join(package_path_abs, "src")) or os.path.isdir(
             os.path.join(package_path_abs, "include")
@@ -81,41 +120,81 @@ def create_package_job(context, package, package_path, deps, doc_deps):
             rosdoc_conf = [{"builder": "doxygen"}]
         else:
             rosdoc_conf = []
+    return rosdoc_conf
+
+
+def create_package_job(
+    context,
+    package,
+    package_path,
+    deps,
+    doc_deps,
+    archive_dir=None,
+    fast_summary=False,
+    defer_finish=False,
+    toolchain=None,
+):
+    docs_space = os.path.join(context.docs_space_abs, package.name)
+    docs_build_space = os.path.join(context.build_space_abs, "docs", package.name)
+    package_path_abs = os.path.join(context.source_space_abs, package_path)
+    package_meta_path = context.package_metadata_path(package)
+
+    # Load rosdoc config, if it exists.
+    rosdoc_conf = load_rosdoc_conf(package, package_path_abs)
 
     stages = []
 
     # Create package docs spaces.
     stages.append(FunctionStage("mkdir_docs_build_space", makedirs, path=docs_build_space))
 
-    # Generate msg/srv/action docs with package summary page.
-    stages.append(
-        FunctionStage(
-            "generate_messages",
-            generate_messages,
-            package=package,
-            package_path=package_path,
-            output_path=docs_build_space,
+    # A previous run hardlinked this package's static assets to other packages' copies; drop
+    # them so the generators below don't write through the links.
+    if os.path.isfile(os.path.join(context.docs_space_abs, DEDUPE_MARKER)) and os.path.isdir(docs_space):
+        stages.append(FunctionStage("release_shared_assets", release_shared_assets, docs_path=docs_space))
+
+    # Generate msg/srv/action docs with package summary page, as Sphinx sources for the summary job
+    # or, for a fast summary, as HTML right away.
+    if fast_summary:
+        stages.append(
+            FunctionStage(
+                "render_package_summary",
+                render_package_summary,
+                package=package,
+                package_path=package_path_abs,
+                rosdoc_conf=rosdoc_conf,
+                docs_path=docs_space,
+                docs_build_path=docs_build_space,
+            )
         )
-    )
-    stages.append(
-        FunctionStage(
-            "generate_services",
-            generate_services,
-            package=package,
-            package_path=package_path,
-            output_path=docs_build_space,
+    else:
+        stages.append(
+            FunctionStage(
+                "generate_messages",
+                generate_messages,
+                package=package,
+                package_path=package_path,
+                output_path=docs_build_space,
+            )
         )
-    )
-    stages.append(
-        FunctionStage(
-            "generate_package_summary",
-            generate_package_summary,
-            package=package,
-            package_path=package_path_abs,
-            rosdoc_conf=rosdoc_conf,
-            output_path=docs_build_space,
+        stages.append(
+            FunctionStage(
+                "generate_services",
+                generate_services,
+                package=package,
+                package_path=package_path,
+                output_path=docs_build_space,
+            )
+        )
+        stages.append(
+            FunctionStage(
+                "generate_package_summary",
+                generate_package_summary,
+                package=package,
+                package_path=package_path_abs,
+                rosdoc_conf=rosdoc_conf,
+                output_path=docs_build_space,
+            )
         )
-    )
 
     # Cache document config
     stages.append(
@@ -132,45 +211,221 @@ def create_package_job(context, package, package_path, deps, doc_deps):
     # Add steps to run native doc generators, as appropriate. This has to happen after
     # the package summary generates, as we're going to override the subdirectory index.html
     # files generated by that sphinx run.
+    registered_builders = load_builders()
     for conf in rosdoc_conf:
-        try:
-            builder = conf["builder"]
-            if builder == "doxygen":
-                docs_space = os.path.realpath(docs_space)
-                docs_build_space = os.path.realpath(docs_build_space)
-                package_path_abs = os.path.realpath(package_path_abs)
-            stages.extend(
-                getattr(builders, builder)(
-                    conf, package, deps, doc_deps, docs_space, package_path_abs, docs_build_space, job_env
-                )
-            )
-        except AttributeError:
+        builder = conf["builder"]
+        if builder not in registered_builders:
             log(
                 fmt(
                     "[document] @!@{yf}Warning:@| Skipping unrecognized rosdoc builder [%s] for package [%s]"
-                    % (conf["builder"], package.name)
+                    % (builder, package.name)
                 )
             )
+            continue
+        if registered_builders[builder].get("standalone"):
+            # Runs as a job of its own, see create_standalone_jobs.
+            continue
+        if builder == "doxygen":
+            docs_space = os.path.realpath(docs_space)
+            docs_build_space = os.path.realpath(docs_build_space)
+            package_path_abs = os.path.realpath(package_path_abs)
+        builder_stages = registered_builders[builder]["create_stages"](
+            conf, package, deps, doc_deps, docs_space, package_path_abs, docs_build_space, job_env, toolchain
+        )
+        stage_limits = dict((key, conf[key]) for key in STAGE_LIMIT_KEYS if key in conf)
+        if stage_limits:
+            for stage in builder_stages:
+                if type(stage) is CommandStage:
+                    stage.logger_factory = MonitoredIOBufferProtocol.factory_with(**stage_limits)
+        stages.extend(builder_stages)
+
+    # With standalone builders, the package's docs are only complete once their jobs are done too, see
+    # create_package_finish_job.
+    if not defer_finish:
+        stages.extend(_package_finish_stages(context, package, rosdoc_conf, archive_dir))
 
     return Job(jid=package.name, deps=deps, env=job_env, stages=stages)
 
 
-def create_summary_job(context, package_names):
+def _package_finish_stages(context, package, rosdoc_conf, archive_dir):
+    docs_space = os.path.join(context.docs_space_abs, package.name)
+
+    # Record what this job produced, for publishing only what changed.
+    stages = [FunctionStage("write_package_manifest", write_package_manifest, docs_path=docs_space)]
+
+    # Pack the generated API docs as soon as they're complete.
+    if archive_dir and rosdoc_conf:
+        stages.append(
+            FunctionStage(
+                "archive_package_docs",
+                archive_package_docs,
+                docs_space=context.docs_space_abs,
+                package_name=package.name,
+                archive_dir=archive_dir,
+            )
+        )
+    return stages
+
+
+def create_package_finish_job(context, package, package_path, job_ids, archive_dir=None):
+    """Job which records and packs a package's docs once the package's job and its standalone builder
+    jobs, which write to the same docs, are all done."""
+    rosdoc_conf = load_rosdoc_conf(package, os.path.join(context.source_space_abs, package_path))
+    return Job(
+        jid="%s:finish" % package.name,
+        deps=list(job_ids),
+        env={},
+        stages=_package_finish_stages(context, package, rosdoc_conf, archive_dir),
+    )
+
+
+def create_standalone_jobs(context, package, package_path, toolchain=None):
+    """Jobs of the package's standalone builders (see registry.BUILDERS_GROUP) whose inputs changed.
+
+    These don't depend on any other docs, so they run in parallel with the package's job rather than
+    as part of it. Whether the inputs changed is decided now, against the fingerprint recorded when
+    the builder last succeeded, so that unchanged builders don't even get a job.
+    """
+    docs_space = os.path.join(context.docs_space_abs, package.name)
+    docs_build_space = os.path.join(context.build_space_abs, "docs", package.name)
+    package_path_abs = os.path.join(context.source_space_abs, package_path)
+
+    registered_builders = load_builders()
+    jobs = []
+    for conf in load_rosdoc_conf(package, package_path_abs):
+        description = registered_builders.get(conf["builder"])
+        if description is None or not description.get("standalone"):
+            continue
+        # Aliases of a builder share its files, see registry.builder_name.
+        builder = builder_name(conf["builder"], registered_builders)
+
+        fingerprint = input_fingerprint(
+            description, conf, package_path_abs, docs_space, docs_build_space, toolchain=toolchain
+        )
+        fingerprint_path = os.path.join(docs_build_space, input_fingerprint_file(builder))
+        output_marker_path = os.path.join(docs_build_space, output_dir_file(builder))
+        if os.path.isfile(fingerprint_path) and os.path.isfile(output_marker_path):
+            with open(fingerprint_path) as f:
+                if f.read() == fingerprint:
+                    continue
+
+        builder_stages = description["create_stages"](
+            conf, package, [], [], docs_space, package_path_abs, docs_build_space, {}, toolchain
+        )
+        if not builder_stages:
+            continue
+        stages = [FunctionStage("mkdir_docs_build_space", makedirs, path=docs_build_space)]
+        # Like the package's job does for the rest of its docs, see create_package_job.
+        output_dir = os.path.join(docs_space, "html", builder_output_dir(conf, registered_builders))
+        if os.path.isfile(os.path.join(context.docs_space_abs, DEDUPE_MARKER)) and os.path.isdir(output_dir):
+            stages.append(FunctionStage("release_shared_assets", release_shared_assets, docs_path=output_dir))
+        stages.extend(builder_stages)
+        stages.append(
+            FunctionStage(
+                "cache_%s_fingerprint" % builder, write_file, contents=fingerprint, dest_path=fingerprint_path
+            )
+        )
+        jobs.append(Job(jid="%s:%s" % (package.name, builder), deps=[], env={}, stages=stages))
+    return jobs
+
+
+def create_summary_job(
+    context,
+    job_ids,
+    workspace_package_names,
+    dedupe_assets=False,
+    precompress=None,
+    archive_dir=None,
+    fast_summary=False,
+    check_links=False,
+    toolchain=None,
+):
     docs_space = context.docs_space_abs
     docs_build_space = os.path.join(context.build_space_abs, "docs")
 
     stages = []
 
-    stages.append(FunctionStage("generate_overall_summary", generate_overall_summary, output_path=docs_build_space))
+    # Drop the docs of packages which were removed from the workspace or renamed, before they get summarized.
+    stages.append(
+        FunctionStage(
+            "prune_stale_packages",
+            prune_stale_packages,
+            docs_space=docs_space,
+            docs_build_space=docs_build_space,
+            workspace_package_names=workspace_package_names,
+        )
+    )
+    if fast_summary:
+        # The package jobs already rendered their pages, so only the top-level one is left.
+        stages.append(
+            FunctionStage(
+                "render_overall_summary",
+                render_overall_summary,
+                docs_space=docs_space,
+                docs_build_space=docs_build_space,
+                package_names=workspace_package_names,
+            )
+        )
+    else:
+        stages.append(
+            FunctionStage(
+                "generate_overall_summary",
+                generate_overall_summary,
+                output_path=docs_build_space,
+                package_names=workspace_package_names,
+            )
+        )
+
+        # Run Sphinx for the package summary. Its sources are only rewritten when they change, so an
+        # incremental build only renders the pages of packages whose summaries changed. Its static
+        # files may be hardlinked to packages' by an earlier run, so it gets copies of them first.
+        if os.path.isfile(os.path.join(docs_space, DEDUPE_MARKER)):
+            stages.append(FunctionStage("release_summary_assets", release_summary_assets, docs_space=docs_space))
+        stages.append(
+            CommandStage(
+                "summary_sphinx",
+                [toolchain.path("sphinx-build"), "-j8", docs_build_space, docs_space],
+                cwd=docs_build_space,
+            )
+        )
+
+    # Search across all packages from the top-level page.
+    stages.append(
+        FunctionStage(
+            "build_search_index",
+            build_search_index,
+            docs_space=docs_space,
+            docs_build_space=docs_build_space,
+            package_names=workspace_package_names,
+        )
+    )
+
+    # Check the links within and between packages once all the pages are written.
+    if check_links:
+        stages.append(
+            FunctionStage("check_links", check_doc_links, docs_space=docs_space, docs_build_space=docs_build_space)
+        )
+
+    # Post-process the whole docs space for publishing.
+    if precompress:
+        stages.append(FunctionStage("precompress_docs", precompress_docs, docs_path=docs_space, formats=precompress))
+    if dedupe_assets:
+        stages.append(FunctionStage("deduplicate_static_assets", deduplicate_static_assets, docs_path=docs_space))
+    if archive_dir:
+        stages.append(
+            FunctionStage("archive_summary_docs", archive_summary_docs, docs_space=docs_space, archive_dir=archive_dir)
+        )
 
-    # Run Sphinx for the package summary.
     stages.append(
-        CommandStage(
-            "summary_sphinx", [which("sphinx-build"), "-j8", "-E", docs_build_space, docs_space], cwd=docs_build_space
+        FunctionStage(
+            "write_workspace_manifest",
+            write_workspace_manifest,
+            docs_space=docs_space,
+            workspace_package_names=workspace_package_names,
         )
     )
 
-    return Job(jid="summary", deps=package_names, env={}, stages=stages)
+    return Job(jid="summary", deps=job_ids, env={}, stages=stages)
 
 
 def document_workspace(
@@ -187,12 +442,26 @@ def document_workspace(
     no_notify=False,
     continue_on_failure=False,
     summarize_build=None,
+    workspace_packages=None,
+    dedupe_assets=False,
+    precompress=None,
+    archive_dir=None,
+    mem_limit_kb=None,
+    event_log_path=None,
+    stage_timeout=None,
+    stall_timeout=None,
+    shard=None,
+    merge_shards=False,
+    fast_summary=False,
+    check_links=False,
 ):
     pre_start_time = time.time()
 
-    # Get all the packages in the context source space
+    # Get all the packages in the context source space, unless the caller (eg, the watch
+    # loop) already holds them in memory.
     # Suppress warnings since this is a utility function
-    workspace_packages = find_packages(context.source_space_abs, exclude_subspaces=True, warnings=[])
+    if workspace_packages is None:
+        workspace_packages = find_packages(context.source_space_abs, exclude_subspaces=True, warnings=[])
 
     # If no_deps is given, ensure packages to build are provided
     if no_deps and packages is None:
@@ -242,10 +511,73 @@ def document_workspace(
     # Get the names of all packages to be built
     packages_to_be_documented_names = [p.name for _, p in packages_to_be_documented]
 
+    # Check every rosdoc.yaml now, so that a bad one fails the run before anything is documented
+    # rather than after its package's dependencies are.
+    load_config_cache(config_cache_path(context))
+    rosdoc_yaml_paths = dict(
+        (rosdoc_yaml_path(pkg, os.path.join(context.source_space_abs, pkg_path)), pkg.name)
+        for pkg_path, pkg in packages_to_be_documented
+    )
+    rosdoc_yaml_paths.pop(None, None)
+    invalid_configs = validate_rosdoc_yamls(sorted(rosdoc_yaml_paths))
+    save_config_cache(config_cache_path(context))
+    if invalid_configs:
+        for path, ex in sorted(invalid_configs.items()):
+            for error in ex.errors:
+                log(
+                    fmt(
+                        "[document] @!@{rf}Error:@| Invalid rosdoc config of package [%s] in %s: %s"
+                        % (rosdoc_yaml_paths[path], path, error)
+                    )
+                )
+        return 1
+
+    # Find the tools the run needs, and fail now rather than when a job gets to one that's missing.
+    registered_builders = load_builders()
+    required_tools = {}
+    if shard is None and not fast_summary:
+        required_tools["sphinx-build"] = ["summary"]
+    all_tools = set(required_tools)
+    for pkg_path, pkg in packages_to_be_documented:
+        for conf in load_rosdoc_conf(pkg, os.path.join(context.source_space_abs, pkg_path)):
+            description = registered_builders.get(conf["builder"], {})
+            for tool in description.get("tools", []):
+                required_tools.setdefault(tool, []).append(pkg.name)
+            all_tools.update(builder_tools(description))
+    toolchain = Toolchain(all_tools).probe(toolchain_cache_path(context))
+    missing_tools = toolchain.missing(required_tools)
+    if missing_tools:
+        for tool in sorted(missing_tools, key=str):
+            log(
+                fmt(
+                    "[document] @!@{rf}Error:@| %s is needed to document %s, but it isn't installed."
+                    % (
+                        " or ".join(tool) if isinstance(tool, tuple) else tool,
+                        ", ".join("[%s]" % name for name in sorted(set(required_tools[tool]))),
+                    )
+                )
+            )
+        return 1
+
+    # When sharded, this process documents only its share of the packages, and waits for the other
+    # shards (sharing the workspace) to document the dependencies it doesn't.
+    shard_marker_dir = shard_markers_path(context)
+    shard_names = packages_to_be_documented_names
+    if shard is not None:
+        shard_names = assign_shard(packages_to_be_documented_names, *shard)
+
     jobs = []
+    job_costs = {}
+    # Jobs of each package: its own plus those of its standalone builders.
+    package_job_ids = {}
+    # Packages documented by other shards which a job needs, see ShardAdmission.
+    other_shard_deps = {}
 
     # Construct jobs
     for pkg_path, pkg in packages_to_be_documented:
+        if merge_shards or pkg.name not in shard_names:
+            continue
+
         # Get actual execution deps
         deps = [p.name for _, p in get_cached_recursive_build_depends_in_workspace(pkg, packages_to_be_documented)]
         doc_deps = [
@@ -255,13 +587,160 @@ def document_workspace(
             )
         ]
 
-        jobs.append(create_package_job(context, pkg, pkg_path, deps, doc_deps))
-
-    # Special job for post-job summary sphinx step.
-    jobs.append(create_summary_job(context, package_names=packages_to_be_documented_names))
+        other_shard_deps[pkg.name] = [name for name in deps if name not in shard_names]
+        standalone_jobs = create_standalone_jobs(context, pkg, pkg_path, toolchain=toolchain)
+        job = create_package_job(
+            context,
+            pkg,
+            pkg_path,
+            [name for name in deps if name in shard_names],
+            doc_deps,
+            archive_dir=archive_dir,
+            fast_summary=fast_summary,
+            defer_finish=bool(standalone_jobs),
+            toolchain=toolchain,
+        )
+        if other_shard_deps[pkg.name]:
+            job.stages.insert(
+                0,
+                FunctionStage(
+                    "check_shards",
+                    check_shard_packages,
+                    marker_dir=shard_marker_dir,
+                    package_names=other_shard_deps[pkg.name],
+                ),
+            )
+        if fast_summary:
+            # Add the package to the top-level page as soon as it's documented.
+            job.stages.append(
+                FunctionStage(
+                    "update_overall_summary",
+                    render_overall_summary,
+                    docs_space=context.docs_space_abs,
+                    docs_build_space=os.path.join(context.build_space_abs, "docs"),
+                    package_names=[p.name for p in workspace_packages.values()],
+                )
+            )
+        jobs.append(job)
+        job_costs[pkg.name] = builder_cost(load_rosdoc_conf(pkg, os.path.join(context.source_space_abs, pkg_path)))
+
+        jobs.extend(standalone_jobs)
+        package_job_ids[pkg.name] = [pkg.name] + [j.jid for j in standalone_jobs]
+        if standalone_jobs:
+            finish_job = create_package_finish_job(
+                context, pkg, pkg_path, package_job_ids[pkg.name], archive_dir=archive_dir
+            )
+            jobs.append(finish_job)
+            package_job_ids[pkg.name].append(finish_job.jid)
+
+    shard_marker_writer = None
+    dependency_pruner = None
+    if shard is not None:
+        shard_marker_writer = ShardMarkerWriter(shard_marker_dir, package_job_ids)
+
+    # Start the most expensive packages first when several are ready, so that they don't end up
+    # running alone at the end of the build.
+    jobs.sort(key=lambda job: -job_costs.get(job.jid, 0))
+
+    # Special job for post-job summary sphinx step. Shards leave it to the merge step, which runs
+    # it over their combined output once they've all finished.
+    if shard is None:
+        summary_job = create_summary_job(
+            context,
+            job_ids=sum(package_job_ids.values(), []),
+            workspace_package_names=[pkg.name for pkg in workspace_packages.values()],
+            dedupe_assets=dedupe_assets,
+            precompress=precompress,
+            archive_dir=archive_dir,
+            fast_summary=fast_summary,
+            check_links=check_links,
+            toolchain=toolchain,
+        )
+        if merge_shards:
+            summary_job.deps = []
+            other_shard_deps[summary_job.jid] = packages_to_be_documented_names
+            summary_job.stages.insert(
+                0,
+                FunctionStage(
+                    "check_shards",
+                    check_shard_packages,
+                    marker_dir=shard_marker_dir,
+                    package_names=packages_to_be_documented_names,
+                ),
+            )
+            summary_job.stages.append(
+                FunctionStage("clear_shard_markers", clear_shard_markers, marker_dir=shard_marker_dir)
+            )
+        elif continue_on_failure:
+            # Summarize whichever packages succeeded, rather than getting the summary abandoned as soon
+            # as one of them fails.
+            dependency_pruner = FailedDependencyPruner(summary_job)
+            summary_job.stages.insert(
+                0,
+                FunctionStage("report_dropped_dependencies", report_dropped_dependencies, pruner=dependency_pruner),
+            )
+        jobs.append(summary_job)
+
+    # Track the peak memory and progress of every command.
+    history = StageHistory(stage_history_path(context))
+    # Timeouts given in rosdoc.yaml take precedence over the ones given for the whole run.
+    default_limits = dict(timeout=stage_timeout, stall_timeout=stall_timeout)
+    for job in jobs:
+        for stage in job.stages:
+            if type(stage) is CommandStage:
+                options = dict(default_limits, history=history)
+                options.update(getattr(stage.logger_factory, "options", {}))
+                stage.logger_factory = MonitoredIOBufferProtocol.factory_with(**options)
 
     # Queue for communicating status
-    event_queue = Queue()
+    event_queue = EventQueue([dependency_pruner.on_event] if dependency_pruner is not None else [])
+
+    # Jobs which need packages of other shards stay queued until those are done, rather than starting and
+    # waiting in a stage. This check comes first, so that held back jobs don't reserve memory.
+    admission_checks = []
+    if any(other_shard_deps.values()):
+
+        def log_shard_wait(job_id, package_names):
+            event_queue.put(
+                ExecutionEvent(
+                    "MESSAGE",
+                    msg="[document] [%s] Waiting for other shards to document: %s" % (job_id, ", ".join(package_names)),
+                )
+            )
+
+        admission_checks.append(ShardAdmission(shard_marker_dir, other_shard_deps, on_wait=log_shard_wait).admit)
+
+    # Admit jobs against the memory limit if one is set. Jobs which don't fit stay queued until running
+    # ones finish, rather than starting and waiting in a stage.
+    if mem_limit_kb:
+
+        def log_memory_wait(job_id, predicted_kb, reserved_kb):
+            event_queue.put(
+                ExecutionEvent(
+                    "MESSAGE",
+                    msg="[document] [%s] Waiting for %d MiB of memory, %d of %d MiB reserved by running jobs."
+                    % (job_id, predicted_kb >> 10, reserved_kb >> 10, mem_limit_kb >> 10),
+                )
+            )
+
+        memory_budget = MemoryBudget(
+            mem_limit_kb,
+            dict((job.jid, predict_peak_rss_kb(history, job.jid)) for job in jobs),
+            on_wait=log_memory_wait,
+        )
+        event_queue.listeners.append(memory_budget.on_event)
+        admission_checks.append(memory_budget.admit)
+
+    event_log = None
+    if event_log_path is not None:
+        output_dirs = dict(
+            (name, [os.path.join(context.docs_space_abs, name)]) for name in packages_to_be_documented_names
+        )
+        output_dirs["summary"] = [context.docs_space_abs]
+        event_log = EventLogWriter(event_log_path, output_dirs=output_dirs)
+        event_queue.listeners.append(event_log.on_event)
+    if shard_marker_writer is not None:
+        event_queue.listeners.append(shard_marker_writer.on_event)
 
     try:
         # Spin up status output thread
@@ -299,6 +778,7 @@ def document_workspace(
                     max_toplevel_jobs=n_jobs,
                     continue_on_failure=continue_on_failure,
                     continue_without_deps=False,
+                    admit=lambda job: all(check(job) for check in admission_checks),
                 )
             )
 
@@ -316,3 +796,10 @@ def document_workspace(
         event_queue.put(None)
 
         return 130  # EOWNERDEAD
+
+    finally:
+        history.save()
+        if shard_marker_writer is not None:
+            shard_marker_writer.close()
+        if event_log is not None:
+            event_log.close()
@@ -15,11 +15,42 @@
 from catkin_tools.common import mkdir_p
 
 import copy
+import json
 import xml.etree.ElementTree as etree
 import os
 import pkg_resources
 
+from .inventory import write_inventory
+from .pyworker import submit
 from .util import output_dir_file
+from .util import write_if_changed
+
+# Symbols of a package's doxygen docs as [name, kind, uri relative to its HTML output], in its docs
+# build space, for the search index.
+DOXYGEN_SYMBOLS_FILE = "doxygen_symbols.json"
+
+# Doxygen compounds and members worth finding by name.
+DOXYGEN_COMPOUND_KINDS = ("class", "struct", "union", "namespace", "interface", "protocol", "exception")
+DOXYGEN_MEMBER_KINDS = ("function", "variable", "typedef", "enum", "enumvalue", "define", "signal", "slot")
+
+# Sphinx domain roles of the doxygen kinds which Sphinx can cross-reference; Sphinx's C++ domain has
+# no objects for the rest, eg, namespaces.
+DOXYGEN_INVENTORY_ROLES = {
+    # Sphinx describes structs, interfaces and exceptions as classes.
+    "class": "cpp:class",
+    "struct": "cpp:class",
+    "interface": "cpp:class",
+    "exception": "cpp:class",
+    "union": "cpp:union",
+    "function": "cpp:function",
+    "signal": "cpp:function",
+    "slot": "cpp:function",
+    "variable": "cpp:member",
+    "typedef": "cpp:type",
+    "enum": "cpp:enum",
+    "enumvalue": "cpp:enumerator",
+    "define": "c:macro",
+}
 
 
 def _write_config(f, conf):
@@ -132,6 +163,95 @@ def filter_doxygen_tags(logger, event_queue, docs_build_path):
     return 0
 
 
+def read_doxygen_symbols(xml_index_path):
+    """Symbols (name, kind, uri) of a doxygen XML index, streamed so large indexes aren't held in memory.
+
+    Uris are relative to the doxygen HTML output. Module-level function so it can run on the worker pool.
+    """
+    symbols = []
+    seen = set()
+    compound = None
+    in_member = False
+    for event, element in etree.iterparse(xml_index_path, events=("start", "end")):
+        if event == "start":
+            if element.tag == "compound":
+                # A compound's <name> comes before its members.
+                compound = dict(kind=element.get("kind"), refid=element.get("refid"), name=None)
+            elif element.tag == "member":
+                in_member = True
+            continue
+
+        if element.tag == "name" and compound is not None and not in_member:
+            compound["name"] = element.text or ""
+            if compound["kind"] in DOXYGEN_COMPOUND_KINDS:
+                symbols.append((compound["name"], compound["kind"], "%s.html" % compound["refid"]))
+        elif element.tag == "member":
+            in_member = False
+            refid = element.get("refid", "")
+            kind = element.get("kind")
+            # Members are listed under their file as well as their class or namespace; the first wins.
+            if kind in DOXYGEN_MEMBER_KINDS and "_1" in refid and refid not in seen:
+                seen.add(refid)
+                name = element.findtext("name", "")
+                if compound["kind"] in DOXYGEN_COMPOUND_KINDS:
+                    name = compound["name"] + "::" + name
+                page, anchor = refid.rsplit("_1", 1)
+                symbols.append((name, kind, "%s.html#%s" % (page, anchor)))
+        elif element.tag == "compound":
+            compound = None
+            element.clear()
+    return symbols
+
+
+def generate_doxygen_inventory(logger, event_queue, package, output_path, docs_build_path):
+    """
+    FunctionStage functor that turns the XML output of doxygen into an objects.inv next to its HTML,
+    so that Sphinx packages can cross-reference C++ symbols through their intersphinx mapping, and
+    into a symbol table in the docs build space, DOXYGEN_SYMBOLS_FILE, for the search index. The XML
+    is parsed on the worker pool, so the packages being documented convert theirs in parallel. Without
+    an XML index, eg, with GENERATE_XML = NO, the inventory is skipped rather than failing the package.
+
+    :param logger:
+    :param event_queue:
+    :param package: Package being documented
+    :param output_path: Package directory in the docs space
+    :param docs_build_path: Package directory in the docs build space
+    :return: return code
+    """
+    with open(os.path.join(docs_build_path, output_dir_file("doxygen"))) as f:
+        output_dir = f.read()
+    xml_index_path = os.path.join(output_path, "xml", "index.xml")
+    if not os.path.exists(xml_index_path):
+        # Configs which set GENERATE_XML = NO still document the package, just without an inventory. Drop
+        # the ones of an earlier build so that they don't outlive the symbols they list.
+        logger.err("Doxygen did not write an XML index to %s, skipping the inventory." % xml_index_path)
+        for path in (os.path.join(output_dir, "objects.inv"), os.path.join(docs_build_path, DOXYGEN_SYMBOLS_FILE)):
+            if os.path.exists(path):
+                os.remove(path)
+        return 0
+    try:
+        symbols = submit(read_doxygen_symbols, xml_index_path).result()
+    except (OSError, etree.ParseError) as ex:
+        logger.err("Could not read the doxygen XML index %s: %s" % (xml_index_path, ex))
+        return 1
+
+    write_inventory(
+        os.path.join(output_dir, "objects.inv"),
+        package.name,
+        package.version,
+        (
+            (name, DOXYGEN_INVENTORY_ROLES[kind], 1, uri, name)
+            for name, kind, uri in symbols
+            if kind in DOXYGEN_INVENTORY_ROLES
+        ),
+    )
+    write_if_changed(
+        os.path.join(docs_build_path, DOXYGEN_SYMBOLS_FILE),
+        json.dumps([list(symbol) for symbol in symbols], separators=(",", ":")),
+    )
+    return 0
+
+
 _base_config = {
     "ALLEXTERNALS": False,
     "ALPHABETICAL_INDEX": False,
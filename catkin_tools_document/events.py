@@ -0,0 +1,150 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import threading
+
+from catkin_tools.execution.events import ExecutionEvent
+
+try:
+    # Python3
+    from queue import Queue
+except ImportError:
+    # Python2
+    from Queue import Queue
+
+
+class EventQueue(Queue):
+    """Queue of ExecutionEvents which also hands each event to a list of listeners as it is put.
+
+    The executor and the console status controller only know about the queue, so this is where the
+    document verb gets to observe a run (job completion, stage output, progress) as it happens.
+    Listeners are called on the putting thread and must be quick and must not raise.
+    """
+
+    def __init__(self, listeners=None):
+        Queue.__init__(self)
+        self.listeners = list(listeners or [])
+
+    def put(self, item, block=True, timeout=None):
+        if item is not None:
+            for listener in self.listeners:
+                listener(item)
+        Queue.put(self, item, block, timeout)
+
+
+class EventLogWriter(object):
+    """EventQueue listener which streams every event of a run to a newline-delimited JSON file.
+
+    Each line has the event's id and time plus its data. Finished jobs and stages also get their
+    duration, and finished jobs the number of bytes in their output directories. Serializing and
+    measuring happen on a writer thread, so the executor isn't slowed down.
+    """
+
+    # Event data which is bulky and repeats what other events already carry.
+    _OMITTED_FIELDS = ("stdout", "stderr", "interleaved", "env")
+
+    def __init__(self, path, output_dirs=None):
+        self.path = path
+        self.output_dirs = output_dirs or {}
+        self._start_times = {}
+        self._queue = Queue()
+        self._file = open(path, "a")
+        self._thread = threading.Thread(target=self._run, name="event_log")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def on_event(self, event):
+        self._queue.put(event)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def _directory_bytes(self, path):
+        total = 0
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, filename)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def _record(self, event):
+        record = {"event": event.event_id, "time": event.time}
+        record.update((k, v) for k, v in event.data.items() if k not in self._OMITTED_FIELDS)
+
+        job_id = event.data.get("job_id")
+        if event.event_id == "STARTED_JOB":
+            self._start_times[job_id] = event.time
+        elif event.event_id == "STARTED_STAGE":
+            self._start_times[(job_id, event.data["stage_label"])] = event.time
+        elif event.event_id == "FINISHED_JOB":
+            if job_id in self._start_times:
+                record["duration"] = event.time - self._start_times.pop(job_id)
+            if job_id in self.output_dirs:
+                record["bytes"] = sum(self._directory_bytes(path) for path in self.output_dirs[job_id])
+        elif event.event_id == "FINISHED_STAGE":
+            key = (job_id, event.data["stage_label"])
+            if key in self._start_times:
+                record["duration"] = event.time - self._start_times.pop(key)
+        return record
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                break
+            self._file.write(json.dumps(self._record(event), default=str) + "\n")
+            # Flush each event, so that a dashboard tailing the file sees the run as it happens.
+            self._file.flush()
+
+
+class FailedDependencyPruner(object):
+    """EventQueue listener which drops the jobs that fail or are abandoned from the dependencies of a
+    job, so that the executor still runs it once the rest are done, rather than abandoning it.
+
+    The executor announces a failed or abandoned job before it abandons that job's dependents, and
+    listeners are called on its thread, so the job is already gone from the dependencies by then.
+    Unlike waiting for the jobs in a stage, this leaves the job queued, holding no job slot, until its
+    remaining dependencies are done.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.dropped = []
+
+    def on_event(self, event):
+        if event.event_id == "FINISHED_JOB" and event.data["succeeded"]:
+            return
+        if event.event_id in ("FINISHED_JOB", "ABANDONED_JOB") and event.data["job_id"] in self.job.deps:
+            self.job.deps.remove(event.data["job_id"])
+            self.dropped.append(event.data["job_id"])
+
+
+def report_dropped_dependencies(logger, event_queue, pruner: FailedDependencyPruner) -> int:
+    """
+    FunctionStage functor that lists the dependencies which a job went on without, see FailedDependencyPruner.
+
+    :param logger:
+    :param event_queue:
+    :param pruner: Listener which dropped the job's failed dependencies
+    :return: return code
+    """
+    if pruner.dropped:
+        logger.out("Continuing without the docs of failed or abandoned jobs: %s" % ", ".join(sorted(pruner.dropped)))
+    return 0
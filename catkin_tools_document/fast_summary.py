@@ -0,0 +1,218 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from html import escape
+from typing import List
+
+import os
+import threading
+
+from catkin_tools.common import mkdir_p
+
+from .messages import load_message_types
+from .messages import load_service_types
+from .messages import message_definition
+from .messages import remove_stale_pages
+from .search import SEARCH_BOX_HTML
+from .summary import api_links
+from .summary import package_list_html
+from .summary import read_package_summaries
+from .summary import write_package_summary_file
+from .util import write_if_changed
+
+try:
+    from docutils.core import publish_parts
+except ImportError:
+    publish_parts = None
+
+# Package jobs update the top-level page as they finish, possibly at the same time.
+_overall_summary_lock = threading.Lock()
+
+_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; max-width: 60em; margin: 2em auto; }}
+dt {{ font-weight: bold; margin-top: 1em; }}
+pre {{ background: #f4f4f4; padding: 0.5em; }}
+</style>
+</head>
+<body>
+{breadcrumbs}<h1>{title}</h1>
+{body}
+</body>
+</html>
+"""
+
+
+def _page(title, breadcrumbs, body):
+    links = " &raquo; ".join('<a href="%s">%s</a>' % (href, escape(text)) for href, text in breadcrumbs)
+    return _PAGE.format(title=escape(title), breadcrumbs="<p>%s</p>\n" % links if links else "", body=body)
+
+
+def _person_links_html(people):
+    return ", ".join(
+        (
+            '<a href="mailto:%s">%s</a>' % (escape(person.email), escape(person.name))
+            if person.email
+            else escape(person.name)
+        )
+        for person in people
+    )
+
+
+def _changelog_html(changelog_path):
+    """Body of a package's changelog, as HTML, without its title."""
+    with open(changelog_path) as f:
+        source = f.read()
+    if publish_parts is None:
+        return "<pre>%s</pre>" % escape(source)
+    settings = {"report_level": 5, "halt_level": 5, "output_encoding": "unicode", "file_insertion_enabled": False}
+    parts = publish_parts(source, writer_name="html", settings_overrides=settings)
+    # A changelog with a single release has its heading promoted to the document's subtitle.
+    return parts["html_subtitle"] + parts["body"]
+
+
+def _write_type_pages(path, package_name, kind, types, render_definition):
+    if types:
+        mkdir_p(path)
+        items = "".join('<li><a href="%s.html">%s</a></li>\n' % (escape(name), escape(name)) for name in sorted(types))
+        write_if_changed(
+            os.path.join(path, "index.html"),
+            _page(
+                "%s » %s" % (package_name, kind),
+                [("../../index.html", "Packages"), ("../index.html", package_name)],
+                "<ul>\n%s</ul>\n" % items,
+            ),
+        )
+        for name, type_ in types.items():
+            write_if_changed(
+                os.path.join(path, "%s.html" % name),
+                _page(
+                    name,
+                    [("../../index.html", "Packages"), ("../index.html", package_name), ("index.html", kind)],
+                    render_definition(type_),
+                ),
+            )
+    remove_stale_pages(path, types, extension=".html")
+
+
+def _message_html(msg_type):
+    return "<h2>Definition</h2>\n<pre>%s</pre>\n" % escape(message_definition(msg_type))
+
+
+def _service_html(srv_type):
+    return "<h2>Request Definition</h2>\n<pre>%s</pre>\n<h2>Response Definition</h2>\n<pre>%s</pre>\n" % (
+        escape(message_definition(srv_type._request_class)),
+        escape(message_definition(srv_type._response_class)),
+    )
+
+
+def render_package_summary(logger, event_queue, package, package_path, rosdoc_conf, docs_path, docs_build_path) -> int:
+    """
+    FunctionStage functor that renders a package's summary, message and service pages straight to HTML,
+    in place of generate_package_summary, generate_messages and generate_services and of running the
+    summary's Sphinx build over them. Pages are only written when their contents change.
+
+    :param logger:
+    :param event_queue:
+    :param package: Package to summarize
+    :param package_path: Absolute path of the package's source
+    :param rosdoc_conf: The package's rosdoc configuration
+    :param docs_path: Package directory in the docs space
+    :param docs_build_path: Package directory in the docs build space
+    :return: return code
+    """
+    mkdir_p(docs_path)
+    mkdir_p(docs_build_path)
+
+    msg_types = load_message_types(package.name)
+    srv_types = load_service_types(package.name)
+    _write_type_pages(os.path.join(docs_path, "msg"), package.name, "Messages", msg_types, _message_html)
+    _write_type_pages(os.path.join(docs_path, "srv"), package.name, "Services", srv_types, _service_html)
+
+    # Descriptions are HTML, as in the Sphinx summary's page, see generate_package_summary.
+    body = ["<p>%s</p>" % package.description]
+    if package.maintainers:
+        body.append("<p><strong>Maintainers:</strong> %s</p>" % _person_links_html(package.maintainers))
+    if package.authors:
+        body.append("<p><strong>Authors:</strong> %s</p>" % _person_links_html(package.authors))
+    body.append("<p><strong>License:</strong> %s</p>" % escape(", ".join(package.licenses)))
+    for url in package.urls:
+        if url.type == "repository":
+            body.append('<p><strong>Source:</strong> <a href="%s">%s</a></p>' % (escape(url.url), escape(url.url)))
+            break
+
+    links = api_links(rosdoc_conf)
+    if links:
+        body.append(
+            "<p><strong>API:</strong> %s</p>"
+            % " ".join('<a href="%s">%s</a>' % (escape(link), escape(name)) for name, link in links)
+        )
+
+    contents = []
+    if msg_types:
+        contents.append(("msg/index.html", "Messages"))
+    if srv_types:
+        contents.append(("srv/index.html", "Services"))
+
+    changelog_path = os.path.join(package_path, "CHANGELOG.rst")
+    changelog_page_path = os.path.join(docs_path, "CHANGELOG.html")
+    if os.path.isfile(changelog_path):
+        changelog = _changelog_html(changelog_path)
+        write_if_changed(
+            changelog_page_path,
+            _page("Changelog", [("../index.html", "Packages"), ("index.html", package.name)], changelog),
+        )
+        contents.append(("CHANGELOG.html", "Changelog"))
+    elif os.path.isfile(changelog_page_path):
+        os.unlink(changelog_page_path)
+
+    if contents:
+        body.append(
+            "<ul>\n%s</ul>"
+            % "".join('<li><a href="%s">%s</a></li>\n' % (href, escape(text)) for href, text in contents)
+        )
+
+    write_if_changed(
+        os.path.join(docs_path, "index.html"),
+        _page(package.name, [("../index.html", "Packages")], "\n".join(body) + "\n"),
+    )
+    write_package_summary_file(docs_build_path, package, rosdoc_conf, sorted(msg_types), sorted(srv_types))
+    return 0
+
+
+def render_overall_summary(
+    logger, event_queue, docs_space: str, docs_build_space: str, package_names: List[str]
+) -> int:
+    """
+    FunctionStage functor that renders the top-level page of the docs space straight to HTML, listing
+    the packages whose jobs rendered a summary, in place of generate_overall_summary and its Sphinx build.
+    Each package job runs it once it's done, so that the page grows as the workspace gets documented.
+
+    :param logger:
+    :param event_queue:
+    :param docs_space: Root of the docs space
+    :param docs_build_space: Root of the docs build space
+    :param package_names: Names of all the packages in the workspace
+    :return: return code
+    """
+    mkdir_p(docs_space)
+    with _overall_summary_lock:
+        summaries = read_package_summaries(docs_build_space, package_names)
+        body = SEARCH_BOX_HTML + "\n".join(package_list_html(summaries))
+        write_if_changed(os.path.join(docs_space, "index.html"), _page("Packages", [], body + "\n"))
+    return 0
@@ -0,0 +1,82 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fcntl
+import os
+import threading
+import yaml
+
+from catkin_tools.common import mkdir_p
+
+from .util import write_if_changed
+
+
+def stage_history_path(context):
+    return os.path.join(context.build_space_abs, "docs", ".stage_history.yaml")
+
+
+class StageHistory(object):
+    """Metrics of each job's stages (eg, peak_rss_kb, items, duration) from the most recent run which executed them.
+
+    Used to predict the next run: memory needed before admitting a job, and progress of stages whose
+    output doesn't say how much work is left.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.stages = self._load()
+        # Jobs whose metrics were recorded in this run, which are all that saving writes back.
+        self._recorded = set()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return {}
+        with open(self.path) as f:
+            return yaml.safe_load(f) or {}
+
+    def record(self, job_id, stage_label, **metrics):
+        with self._lock:
+            self.stages.setdefault(job_id, {}).setdefault(stage_label, {}).update(metrics)
+            self._recorded.add(job_id)
+
+    def get(self, job_id, stage_label, metric, default=None):
+        with self._lock:
+            return self.stages.get(job_id, {}).get(stage_label, {}).get(metric, default)
+
+    def job_metric_max(self, job_id, metric):
+        """Largest value of a metric across a job's stages, or None if it was never recorded."""
+        with self._lock:
+            values = [s[metric] for s in self.stages.get(job_id, {}).values() if metric in s]
+        return max(values) if values else None
+
+    def all_jobs_metric_max(self, metric):
+        with self._lock:
+            job_ids = list(self.stages)
+        return [v for v in (self.job_metric_max(job_id, metric) for job_id in job_ids) if v is not None]
+
+    def save(self):
+        """Merge the metrics recorded in this run into the history file.
+
+        Shards running at once share the file, so it's re-read under a lock and only the jobs this run
+        recorded are replaced, rather than overwriting what other shards saved since it was loaded.
+        """
+        mkdir_p(os.path.dirname(self.path))
+        with self._lock:
+            recorded = dict((job_id, self.stages[job_id]) for job_id in self._recorded)
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            stages = self._load()
+            stages.update(recorded)
+            write_if_changed(self.path, yaml.safe_dump(stages))
@@ -12,24 +12,42 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import copy
+import json
 import os.path
 import sys
-import yaml
 
 from catkin_tools.execution.events import ExecutionEvent
 
 from .util import output_dir_file
-
-
-INTERSPHINX_GENERATORS = ["pydoctor", "sphinx"]
-
-
-def generate_intersphinx_mapping(logger, event_queue, output_path, root_dir, doc_deps, docs_build_path, job_env):
-    intersphinx_mapping = copy.copy(_base_intersphinx_mapping)
-
-    python_version = f"{sys.version_info.major}.{sys.version_info.minor}"
-    intersphinx_mapping["python"] = (f"https://docs.python.org/{python_version}/", None)
+from .util import write_if_changed
+
+INTERSPHINX_GENERATORS = ["doxygen", "pydoctor", "pyast", "sphinx"]
+
+# Written to each sphinx package's docs build space, and passed to its conf.py by path.
+INTERSPHINX_MAPPING_FILE = "intersphinx_mapping.json"
+
+
+def generate_intersphinx_mapping(
+    logger, event_queue, output_path, root_dir, doc_deps, docs_build_path, job_env, inline=False
+):
+    """
+    FunctionStage functor that writes the intersphinx mapping of a Sphinx package, for its conf.py to
+    load, to a JSON file whose path it passes in the INTERSPHINX_MAPPING_FILE variable of the job
+    environment. With inline set, the mapping also goes in the environment itself, as YAML in
+    INTERSPHINX_MAPPING, for conf.py files written before the file existed; since that grows with the
+    package's dependencies, it's only done for packages which opt in to it.
+
+    :param logger:
+    :param event_queue:
+    :param output_path: Package directory in the docs space
+    :param root_dir: Directory of the package's conf.py
+    :param doc_deps: Packages whose inventories to map
+    :param docs_build_path: Package directory in the docs build space
+    :param job_env: Job environment
+    :param inline: Whether to also pass the mapping in the environment
+    :return: return code
+    """
+    intersphinx_mapping = dict(_base_intersphinx_mapping)
 
     # Add workspace objects file
     objects_file = os.path.join(output_path, "..", "objects.inv")
@@ -66,12 +84,19 @@ def generate_intersphinx_mapping(logger, event_queue, output_path, root_dir, doc
             )
         )
 
-    job_env["INTERSPHINX_MAPPING"] = yaml.dump(intersphinx_mapping)
+    mapping_path = os.path.join(docs_build_path, INTERSPHINX_MAPPING_FILE)
+    write_if_changed(mapping_path, json.dumps(intersphinx_mapping, indent=1, sort_keys=True))
+    job_env["INTERSPHINX_MAPPING_FILE"] = mapping_path
+    if inline:
+        import yaml
+
+        job_env["INTERSPHINX_MAPPING"] = yaml.dump(intersphinx_mapping)
 
     return 0
 
 
 _base_intersphinx_mapping = {
+    "python": (f"https://docs.python.org/{sys.version_info.major}.{sys.version_info.minor}/", None),
     "catkin_pkg": ("https://docs.ros.org/independent/api/catkin_pkg/html", None),
     "jenkins_tools": ("https://docs.ros.org/independent/api/jenkins_tools/html", None),
     "rosdep": ("https://docs.ros.org/independent/api/rosdep/html", None),
@@ -0,0 +1,75 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Iterable
+from typing import Iterator
+from typing import Tuple
+
+import os
+import zlib
+
+# (name, "domain:role", priority, uri, display name)
+InventoryEntry = Tuple[str, str, int, str, str]
+
+
+def write_inventory(path: str, project: str, version: str, entries: Iterable[InventoryEntry]) -> None:
+    lines = []
+    for name, domain_role, priority, uri, dispname in entries:
+        # The format allows shortening a uri ending in the name to "$", and an unchanged display name to "-".
+        if uri.endswith(name):
+            uri = uri[: -len(name)] + "$"
+        if dispname == name:
+            dispname = "-"
+        lines.append("%s %s %d %s %s\n" % (name, domain_role, priority, uri, dispname))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"# Sphinx inventory version 2\n")
+        f.write(("# Project: %s\n" % project).encode("utf-8"))
+        f.write(("# Version: %s\n" % version).encode("utf-8"))
+        f.write(b"# The remainder of this file is compressed using zlib.\n")
+        f.write(zlib.compress("".join(lines).encode("utf-8"), 9))
+    os.replace(tmp_path, path)
+
+
+def read_inventory(path: str) -> Iterator[InventoryEntry]:
+    with open(path, "rb") as f:
+        header = f.readline()
+        if not header.startswith(b"# Sphinx inventory version 2"):
+            raise ValueError("%s is not a version 2 Sphinx inventory." % path)
+        for _ in range(3):
+            f.readline()
+        body = zlib.decompress(f.read()).decode("utf-8")
+
+    for line in body.splitlines():
+        try:
+            name, domain_role, priority, uri, dispname = _split_entry(line)
+        except ValueError:
+            continue
+        if uri.endswith("$"):
+            uri = uri[:-1] + name
+        if dispname == "-":
+            dispname = name
+        yield name, domain_role, priority, uri, dispname
+
+
+def _split_entry(line):
+    # Names (eg, std:label titles) and display names may contain spaces, so find the
+    # "domain:role priority" pair and split around it.
+    tokens = line.split(" ")
+    for i in range(1, len(tokens) - 2):
+        if ":" in tokens[i] and tokens[i + 1].lstrip("-").isdigit():
+            name = " ".join(tokens[:i])
+            return name, tokens[i], int(tokens[i + 1]), tokens[i + 2], " ".join(tokens[i + 3 :])
+    raise ValueError(line)
@@ -0,0 +1,231 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from html.parser import HTMLParser
+from urllib.parse import unquote
+from urllib.parse import urlsplit
+
+import json
+import os
+import posixpath
+
+from catkin_tools.execution.events import ExecutionEvent
+
+from .pyworker import submit
+from .util import write_if_changed
+
+# Report of the last check, in the docs build space.
+BROKEN_LINKS_FILENAME = "broken_links.json"
+
+# Attributes which link to another file, by tag. Only the targets of <a> and <area> are pages whose
+# anchors are worth checking; the rest are assets.
+LINK_ATTRIBUTES = dict(a="href", area="href", link="href", img="src", script="src", iframe="src")
+ANCHOR_TAGS = ("a", "area")
+
+# Files scanned per task on the worker pool.
+FILES_PER_TASK = 256
+
+# Broken links printed per package; the report file has all of them.
+REPORTED_LINKS = 10
+
+_READ_SIZE = 1 << 16
+
+
+class _LinkParser(HTMLParser):
+    """Collects the anchors a page defines, the links it makes and its <base href>, fed the page a chunk at a time."""
+
+    def __init__(self):
+        super(_LinkParser, self).__init__(convert_charrefs=True)
+        self.anchors = set()
+        self.links = set()
+        self.base = None
+
+    def handle_starttag(self, tag, attrs):
+        # Like browsers, only the first <base href> counts, and it applies to all of the page's links.
+        if tag == "base" and self.base is None:
+            for name, value in attrs:
+                if name == "href" and value:
+                    self.base = value.strip()
+        for name, value in attrs:
+            if value and (name == "id" or (name == "name" and tag == "a")):
+                self.anchors.add(value)
+        attribute = LINK_ATTRIBUTES.get(tag)
+        if attribute is not None:
+            for name, value in attrs:
+                if name == attribute and value:
+                    self.links.add((value.strip(), tag in ANCHOR_TAGS))
+
+    handle_startendtag = handle_starttag
+
+
+def _resolve(page, href, base=None):
+    """Target (docs space relative path, fragment) of a link on a page, or None for links to other sites.
+
+    Relative links are resolved against the page's <base href> if it has one, else against the page.
+    """
+    parts = urlsplit(href)
+    if parts.scheme or parts.netloc or (not parts.path and not parts.fragment):
+        return None
+    if base is not None:
+        resolved_base = _resolve(page, base)
+        if resolved_base is None:
+            # The page's links are relative to another site.
+            return None
+        page = resolved_base[0]
+    path = unquote(parts.path)
+    if not path:
+        return page, unquote(parts.fragment)
+    base = "" if path.startswith("/") else posixpath.dirname(page)
+    target = posixpath.normpath(posixpath.join(base, path.lstrip("/")))
+    if path.endswith("/"):
+        target = posixpath.join(target, "index.html")
+    return target, unquote(parts.fragment)
+
+
+def scan_html_files(docs_space, pages):
+    """Anchors and resolved links of each page, which are docs space relative paths.
+
+    Module-level function so it can run on the worker pool.
+
+    :returns: List of (page, anchors, links), where links are (href, target, fragment, check_fragment)
+    """
+    results = []
+    for page in pages:
+        parser = _LinkParser()
+        with open(os.path.join(docs_space, page), encoding="utf-8", errors="replace") as f:
+            while True:
+                chunk = f.read(_READ_SIZE)
+                if not chunk:
+                    break
+                parser.feed(chunk)
+        parser.close()
+
+        links = []
+        for href, check_fragment in parser.links:
+            resolved = _resolve(page, href, parser.base)
+            if resolved is not None:
+                links.append((href, resolved[0], resolved[1], check_fragment))
+        results.append((page, sorted(parser.anchors), links))
+    return results
+
+
+def _package_of(page):
+    """Package whose docs a page is part of; pages outside of any package's directory are the summary's."""
+    head = page.split("/", 1)[0]
+    return head if "/" in page and not head.startswith(("_", ".")) else ""
+
+
+def find_broken_links(logger, event_queue, docs_space):
+    """Broken links of the docs space, by package.
+
+    :returns: Map of package name ("" for the top-level summary) to a sorted list of (page, href),
+        and the number of links checked
+    """
+    files = set()
+    directories = set()
+    pages = []
+    for root, dirnames, filenames in os.walk(docs_space):
+        rel_root = os.path.relpath(root, docs_space).replace(os.sep, "/")
+        rel_root = "" if rel_root == "." else rel_root + "/"
+        directories.update(rel_root + d for d in dirnames)
+        for filename in filenames:
+            files.add(rel_root + filename)
+            if filename.endswith((".html", ".htm")):
+                pages.append(rel_root + filename)
+    pages.sort()
+
+    futures = [
+        submit(scan_html_files, docs_space, pages[i : i + FILES_PER_TASK]) for i in range(0, len(pages), FILES_PER_TASK)
+    ]
+
+    anchors = {}
+    links = []
+    for index, future in enumerate(futures):
+        for page, page_anchors, page_links in future.result():
+            anchors[page] = frozenset(page_anchors)
+            links.extend((page, link) for link in page_links)
+        event_queue.put(
+            ExecutionEvent(
+                "STAGE_PROGRESS",
+                job_id=logger.job_id,
+                stage_label=logger.stage_label,
+                percent=str(int(100 * index / float(len(futures)))),
+            )
+        )
+
+    # Links which leave the docs space, eg, to the docs of packages which aren't in the workspace, are
+    # checked against the filesystem, once each.
+    outside = {}
+
+    broken = {}
+    for page, (href, target, fragment, check_fragment) in links:
+        if target in directories:
+            target = posixpath.join(target, "index.html")
+        if target.startswith("../") or target == "..":
+            if target not in outside:
+                outside[target] = os.path.exists(os.path.join(docs_space, *target.split("/")))
+            ok = outside[target]
+        elif target not in files:
+            ok = False
+        elif fragment and check_fragment and target in anchors:
+            ok = fragment in anchors[target]
+        else:
+            ok = True
+        if not ok:
+            broken.setdefault(_package_of(page), []).append((page, href))
+
+    for package_links in broken.values():
+        package_links.sort()
+    return broken, len(links)
+
+
+def check_links(logger, event_queue, docs_space: str, docs_build_space: str) -> int:
+    """
+    FunctionStage functor that checks every relative link and anchor of the HTML in the docs space,
+    including those between packages which doxygen tag files and intersphinx produce, and reports the
+    broken ones by package. Pages are parsed in parallel on the worker pool and resolved against an
+    index of the files and anchors of the docs space, so nothing is fetched over the network.
+
+    Broken links are reported, not treated as a failure. All of them are written to
+    BROKEN_LINKS_FILENAME in the docs build space.
+
+    :param logger:
+    :param event_queue:
+    :param docs_space: Root of the docs space
+    :param docs_build_space: Root of the docs build space
+    :return: return code
+    """
+    broken, checked = find_broken_links(logger, event_queue, docs_space)
+
+    for package_name, package_links in sorted(broken.items()):
+        logger.err(
+            "%d broken links in the docs of %s:"
+            % (len(package_links), "[%s]" % package_name if package_name else "the workspace summary")
+        )
+        for page, href in package_links[:REPORTED_LINKS]:
+            logger.err("  %s: %s" % (page, href))
+        if len(package_links) > REPORTED_LINKS:
+            logger.err("  ... and %d more" % (len(package_links) - REPORTED_LINKS))
+
+    total = sum(len(package_links) for package_links in broken.values())
+    report = dict(
+        checked=checked, broken=dict((name, [list(link) for link in links]) for name, links in broken.items())
+    )
+    if not os.path.isdir(docs_build_space):
+        os.makedirs(docs_build_space)
+    write_if_changed(
+        os.path.join(docs_build_space, BROKEN_LINKS_FILENAME), json.dumps(report, indent=1, sort_keys=True)
+    )
+    logger.out("Checked %d links, %d broken in %d packages." % (checked, total, len(broken)))
+    return 0
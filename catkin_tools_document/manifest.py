@@ -0,0 +1,176 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import List
+
+import json
+import os
+import shutil
+
+from catkin_tools.common import mkdir_p
+
+from .util import file_digest
+
+# Written to the docs space root by the summary job, and to each package's directory by its job.
+MANIFEST_FILENAME = ".manifest.json"
+
+
+def read_manifest(path):
+    """Contents of a manifest file, or an empty manifest if it is missing or unreadable."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"files": {}}
+
+
+def scan_files(root, previous=None):
+    """Map each file under root, by path relative to it, to its size, mtime_ns and sha256.
+
+    Hashes are reused from the previous manifest's entries for files whose size and mtime haven't
+    changed, so only new and modified files are read.
+
+    :param root: Directory to scan
+    :param previous: Entries of the previous manifest of root, if any
+    :returns: (entries, number of files which were new or changed)
+    """
+    previous = previous or {}
+    files = {}
+    changed = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename == MANIFEST_FILENAME:
+                continue
+            path = os.path.join(dirpath, filename)
+            st = os.stat(path)
+            rel_path = os.path.relpath(path, root).replace(os.sep, "/")
+            entry = previous.get(rel_path)
+            if entry is None or (entry["size"], entry["mtime_ns"]) != (st.st_size, st.st_mtime_ns):
+                entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": file_digest(path)}
+                if previous.get(rel_path, {}).get("sha256") != entry["sha256"]:
+                    changed += 1
+            files[rel_path] = entry
+    return files, changed
+
+
+def _write_manifest(path, manifest):
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def write_package_manifest(logger, event_queue, docs_path: str) -> int:
+    """
+    FunctionStage functor that writes the manifest of everything a package's job produced in the docs
+    space: each file's path, size and content hash.
+
+    :param logger:
+    :param event_queue:
+    :param docs_path: Package directory in the docs space
+    :return: return code
+    """
+    # Written even when there are no files, so that prune_stale_packages recognizes the directory.
+    mkdir_p(docs_path)
+    manifest_path = os.path.join(docs_path, MANIFEST_FILENAME)
+    previous = read_manifest(manifest_path)["files"]
+    files, changed = scan_files(docs_path, previous)
+    _write_manifest(manifest_path, {"files": files})
+    removed = len(set(previous) - set(files))
+    logger.out("Manifest of %d files: %d new or changed, %d removed." % (len(files), changed, removed))
+    return 0
+
+
+def is_package_docs(path):
+    """Whether a directory holds the docs of a package, ie, a package job wrote its manifest there.
+
+    This is what tells the directories which documenting produced from any others in the docs space.
+    """
+    return os.path.isfile(os.path.join(path, MANIFEST_FILENAME))
+
+
+def stale_package_paths(docs_space, docs_build_space, workspace_package_names):
+    """Paths in the docs and docs build spaces of the packages which are documented but no longer in the workspace.
+
+    :returns: Map of each stale package's name to its paths which exist
+    """
+    if not os.path.isdir(docs_space):
+        return {}
+    stale = {}
+    for name in sorted(os.listdir(docs_space)):
+        if name in workspace_package_names or not is_package_docs(os.path.join(docs_space, name)):
+            continue
+        paths = [
+            os.path.join(docs_space, name),
+            os.path.join(docs_build_space, name),
+            # Sources of the summary Sphinx build's pages of the package.
+            os.path.join(docs_space, "_sources", name),
+        ]
+        stale[name] = [path for path in paths if os.path.lexists(path)]
+    return stale
+
+
+def prune_stale_packages(
+    logger, event_queue, docs_space: str, docs_build_space: str, workspace_package_names: List[str]
+) -> int:
+    """
+    FunctionStage functor that removes the docs of packages which are no longer in the workspace, eg,
+    because they were removed or renamed. Only directories with a package manifest are considered, so
+    nothing which wasn't produced by a package job is touched.
+
+    :param logger:
+    :param event_queue:
+    :param docs_space: Root of the docs space
+    :param docs_build_space: Root of the docs build space
+    :param workspace_package_names: Names of all the packages in the workspace
+    :return: return code
+    """
+    for name, paths in sorted(stale_package_paths(docs_space, docs_build_space, workspace_package_names).items()):
+        logger.out("Removing docs of package [%s], which is no longer in the workspace." % name)
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+    return 0
+
+
+def write_workspace_manifest(logger, event_queue, docs_space: str, workspace_package_names: List[str]) -> int:
+    """
+    FunctionStage functor that writes the manifest of the whole docs space, for publishing only what
+    changed since the last run: each file's path, size and content hash, plus the documented packages.
+
+    Hashes are reused from the package manifests and from the previous workspace manifest, so this
+    mostly only reads the files written by the summary job.
+
+    :param logger:
+    :param event_queue:
+    :param docs_space: Root of the docs space
+    :param workspace_package_names: Names of all the packages in the workspace
+    :return: return code
+    """
+    manifest_path = os.path.join(docs_space, MANIFEST_FILENAME)
+    previous = read_manifest(manifest_path)["files"]
+    known = dict(previous)
+    packages = []
+    for name in sorted(workspace_package_names):
+        package_manifest_path = os.path.join(docs_space, name, MANIFEST_FILENAME)
+        if os.path.isfile(package_manifest_path):
+            packages.append(name)
+            for rel_path, entry in read_manifest(package_manifest_path)["files"].items():
+                known[name + "/" + rel_path] = entry
+
+    files, _ = scan_files(docs_space, known)
+    changed = sum(1 for rel_path, entry in files.items() if previous.get(rel_path, {}).get("sha256") != entry["sha256"])
+    removed = len(set(previous) - set(files))
+    _write_manifest(manifest_path, {"packages": packages, "files": files})
+    logger.out("Manifest of %d files: %d new or changed, %d removed." % (len(files), changed, removed))
+    return 0
@@ -0,0 +1,99 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from argparse import ArgumentTypeError
+
+import math
+
+_SIZE_SUFFIXES = {"K": 1, "M": 1 << 10, "G": 1 << 20, "T": 1 << 30}
+
+
+def memory_size_type(size):
+    """Argparse type for sizes like "512M" or "16G", returned in KiB."""
+    size = size.strip().upper().rstrip("B").rstrip("I")
+    multiplier = _SIZE_SUFFIXES.get(size[-1:], None)
+    try:
+        if multiplier is None:
+            # Plain numbers are bytes.
+            kb = float(size) / 1024
+        else:
+            kb = float(size[:-1]) * multiplier
+    except ValueError:
+        raise ArgumentTypeError("expected a size like 512M or 16G.")
+    if not kb > 0:
+        raise ArgumentTypeError("must be greater than zero.")
+    if not math.isfinite(kb):
+        raise ArgumentTypeError("must be a finite size.")
+    # Round up, so that a limit smaller than 1 KiB doesn't become 0, which means no limit at all.
+    return int(math.ceil(kb))
+
+
+def predict_peak_rss_kb(history, job_id):
+    """Predicted peak of a job: its largest stage, since stages run one after the other.
+
+    Jobs which haven't been observed yet are predicted to need as much as the average job.
+
+    :param history: StageHistory of previous runs
+    :param job_id: Job to predict
+    """
+    peak_kb = history.job_metric_max(job_id, "peak_rss_kb")
+    if peak_kb is not None:
+        return peak_kb
+    job_peaks = history.all_jobs_metric_max("peak_rss_kb")
+    return sum(job_peaks) // len(job_peaks) if job_peaks else 0
+
+
+class MemoryBudget(object):
+    """Admits jobs while the sum of their predicted peaks fits under a ceiling.
+
+    A job is always admitted when nothing else holds a reservation, so a job predicted to exceed the
+    ceiling on its own still runs, just alone. Jobs are admitted by the scheduler before they start, see
+    scheduler.execute_jobs, so those which don't fit wait queued rather than in a stage.
+    """
+
+    def __init__(self, limit_kb, predicted_kb, on_wait=None):
+        """
+        :param limit_kb: Ceiling on the predicted peaks of the running jobs, in KiB
+        :param predicted_kb: Map of job id to predicted peak RSS, in KiB
+        :param on_wait: Called with the job id, its prediction and the reserved total the first time a
+            job doesn't fit
+        """
+        self.limit_kb = limit_kb
+        self.predicted_kb = predicted_kb
+        self.reserved = {}
+        self.on_wait = on_wait
+        self._waiting = set()
+
+    def _fits(self, kb):
+        return not self.reserved or sum(self.reserved.values()) + kb <= self.limit_kb
+
+    def admit(self, job):
+        """Reserve a job's predicted peak if it fits, returning whether it did."""
+        kb = self.predicted_kb.get(job.jid, 0)
+        if not self._fits(kb):
+            if self.on_wait is not None and job.jid not in self._waiting:
+                self.on_wait(job.jid, kb, sum(self.reserved.values()))
+            self._waiting.add(job.jid)
+            return False
+        self._waiting.discard(job.jid)
+        self.reserved[job.jid] = kb
+        return True
+
+    def release(self, job_id):
+        self.reserved.pop(job_id, None)
+
+    def on_event(self, event):
+        """EventQueue listener which returns a job's reservation once it finishes, whether or not it succeeded."""
+        if event.event_id == "FINISHED_JOB":
+            self.release(event.data["job_id"])
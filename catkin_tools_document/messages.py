@@ -14,12 +14,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from contextlib import contextmanager
+
+import io
 import os
 import re
+import shutil
 import yaml
 
 from catkin_tools.common import mkdir_p
 
+from .search import SEARCH_BOX_HTML
+from .summary import api_links
+from .summary import package_list_html
+from .summary import read_package_summaries
+from .summary import write_package_summary_file
+from .util import write_if_changed
+
 CONF_ENVVAR_NAME = "CATKIN_TOOLS_DOCUMENT_CONFIG_FILE"
 
 CONF_DEFAULT = {
@@ -32,23 +43,67 @@ CONF_DEFAULT = {
 }
 
 
+@contextmanager
+def _open_if_changed(path):
+    """Like open(path, "w"), but the file is only written on closing if its contents change, so that
+    Sphinx doesn't consider the page outdated."""
+    f = io.StringIO()
+    yield f
+    write_if_changed(path, f.getvalue())
+
+
+def message_definition(msg_type):
+    """Definition of a message class, without the definitions of the types it uses."""
+    return re.split("^=+$", msg_type._full_text, maxsplit=1, flags=re.MULTILINE)[0]
+
+
+def load_message_types(package_name):
+    """Map the name of each message of a package to its Python class, empty if there are none."""
+    try:
+        msg_module = __import__(package_name + ".msg").msg
+    except:
+        return {}
+    return dict((name, getattr(msg_module, name)) for name in dir(msg_module) if re.match("^[A-Z]", name))
+
+
+def load_service_types(package_name):
+    """Map the name of each service of a package to its Python class, empty if there are none."""
+    try:
+        srv_module = __import__(package_name + ".srv").srv
+    except:
+        return {}
+    return dict(
+        (name, getattr(srv_module, name))
+        for name in dir(srv_module)
+        if re.match("^[A-Z]", name) and hasattr(getattr(srv_module, name), "_request_class")
+    )
+
+
 def _write_raw(f, msg_type):
-    msg_text = re.split("^=+$", msg_type._full_text, maxsplit=1, flags=re.MULTILINE)[0]
-    msg_text = re.sub("^(.*?)$", "    \\1", msg_text, flags=re.MULTILINE)
+    msg_text = re.sub("^(.*?)$", "    \\1", message_definition(msg_type), flags=re.MULTILINE)
     f.write(msg_text)
     f.write("\n")
 
 
+def remove_stale_pages(path, names, extension=".rst"):
+    """Remove the pages of messages or services which no longer exist, eg, after a rename."""
+    if not os.path.isdir(path):
+        return
+    if not names:
+        shutil.rmtree(path)
+        return
+    for filename in os.listdir(path):
+        page_name, page_extension = os.path.splitext(filename)
+        if page_extension == extension and page_name not in names and page_name != "index":
+            os.unlink(os.path.join(path, filename))
+
+
 def generate_messages(logger, event_queue, package, package_path, output_path):
-    try:
-        msg_module = __import__(package.name + ".msg").msg
-        msg_names = [msg_name for msg_name in dir(msg_module) if re.match("^[A-Z]", msg_name)]
-    except:
-        msg_names = []
+    msg_types = load_message_types(package.name)
 
-    if msg_names:
+    if msg_types:
         mkdir_p(os.path.join(output_path, "msg"))
-        with open(os.path.join(output_path, "msg/index.rst"), "w") as f:
+        with _open_if_changed(os.path.join(output_path, "msg/index.rst")) as f:
             f.write("%s » Messages\n" % package.name)
             f.write("=" * 50 + "\n")
             f.write(
@@ -61,28 +116,24 @@ def generate_messages(logger, event_queue, package, package_path, output_path):
             """
             )
 
-        for msg_name in msg_names:
-            msg_type = getattr(msg_module, msg_name)
-            with open(os.path.join(output_path, "msg", "%s.rst" % msg_name), "w") as f:
+        for msg_name, msg_type in sorted(msg_types.items()):
+            with _open_if_changed(os.path.join(output_path, "msg", "%s.rst" % msg_name)) as f:
                 f.write("%s\n" % msg_name)
                 f.write("=" * 50 + "\n\n")
                 f.write("Definition::\n\n")
                 _write_raw(f, msg_type)
 
+    remove_stale_pages(os.path.join(output_path, "msg"), msg_types)
     return 0
 
 
 def generate_services(logger, event_queue, package, package_path, output_path):
-    try:
-        srv_module = __import__(package.name + ".srv").srv
-        srv_names = [srv_name for srv_name in dir(srv_module) if re.match("^[A-Z]", srv_name)]
-    except:
-        srv_names = []
+    srv_types = load_service_types(package.name)
 
-    if srv_names:
+    if srv_types:
         mkdir_p(os.path.join(output_path, "srv"))
 
-        with open(os.path.join(output_path, "srv/index.rst"), "w") as f:
+        with _open_if_changed(os.path.join(output_path, "srv/index.rst")) as f:
             f.write("%s » Services\n" % package.name)
             f.write("=" * 50 + "\n")
             f.write(
@@ -95,16 +146,16 @@ def generate_services(logger, event_queue, package, package_path, output_path):
             """
             )
 
-        for srv_name in srv_names:
-            srv_type = getattr(srv_module, srv_name)
-            if hasattr(srv_type, "_request_class"):
-                with open(os.path.join(output_path, "srv", "%s.rst" % srv_name), "w") as f:
-                    f.write("%s\n" % srv_name)
-                    f.write("=" * 50 + "\n\n")
-                    f.write("Request Definition::\n\n")
-                    _write_raw(f, srv_type._request_class)
-                    f.write("Response Definition::\n\n")
-                    _write_raw(f, srv_type._response_class)
+        for srv_name, srv_type in sorted(srv_types.items()):
+            with _open_if_changed(os.path.join(output_path, "srv", "%s.rst" % srv_name)) as f:
+                f.write("%s\n" % srv_name)
+                f.write("=" * 50 + "\n\n")
+                f.write("Request Definition::\n\n")
+                _write_raw(f, srv_type._request_class)
+                f.write("Response Definition::\n\n")
+                _write_raw(f, srv_type._response_class)
+
+    remove_stale_pages(os.path.join(output_path, "srv"), srv_types)
     return 0
 
 
@@ -127,7 +178,7 @@ def _get_person_links(people):
 def generate_package_summary(logger, event_queue, package, package_path, rosdoc_conf, output_path):
     mkdir_p(output_path)
 
-    with open(os.path.join(output_path, "index.rst"), "w") as f:
+    with _open_if_changed(os.path.join(output_path, "index.rst")) as f:
         f.write("%s\n" % package.name)
         f.write("=" * 50 + "\n\n")
 
@@ -159,11 +210,10 @@ def generate_package_summary(logger, event_queue, package, package_path, rosdoc_
                 f.write("**Source:** %s\n\n" % url_)
                 break
 
-        if rosdoc_conf:
+        links = api_links(rosdoc_conf)
+        if links:
             f.write("**API:** ")
-            for conf in rosdoc_conf:
-                rosdoc_link = os.path.join("html", conf.get("output_dir", ""), "index.html")
-                rosdoc_name = conf.get("name", conf["builder"])
+            for rosdoc_name, rosdoc_link in links:
                 f.write("`%s <%s>`_ " % (rosdoc_name, rosdoc_link))
             f.write("\n\n")
 
@@ -183,37 +233,53 @@ def generate_package_summary(logger, event_queue, package, package_path, rosdoc_
 
         changelog_path = os.path.join(package_path, "CHANGELOG.rst")
         changelog_symlink_path = os.path.join(output_path, "CHANGELOG.rst")
+        if os.path.islink(changelog_symlink_path) and not os.path.isfile(changelog_symlink_path):
+            # The package's changelog was removed or moved since the link was made.
+            os.unlink(changelog_symlink_path)
         if os.path.isfile(changelog_path) and not os.path.isfile(changelog_symlink_path):
             os.symlink(changelog_path, changelog_symlink_path)
 
         if os.path.isfile(changelog_symlink_path):
             f.write("    Changelog <CHANGELOG>\n")
 
+    write_package_summary_file(
+        output_path,
+        package,
+        rosdoc_conf,
+        sorted(load_message_types(package.name)),
+        sorted(load_service_types(package.name)),
+    )
     return 0
 
 
-def generate_overall_summary(logger, event_queue, output_path):
+def generate_overall_summary(logger, event_queue, output_path, package_names):
+    """
+    FunctionStage functor that writes the Sphinx project of the workspace summary: conf.py, and an index
+    which lists the packages whose jobs wrote a summary page, with their descriptions and API links.
+
+    Files are only written when their contents change, so that Sphinx rebuilds just the pages which
+    are affected, rather than the whole summary.
+
+    :param logger:
+    :param event_queue:
+    :param output_path: Root of the docs build space
+    :param package_names: Names of all the packages in the workspace
+    :return: return code
+    """
     conf = CONF_DEFAULT.copy()
     if CONF_ENVVAR_NAME in os.environ:
         with open(os.environ[CONF_ENVVAR_NAME]) as f:
             conf.update(yaml.full_load(f))
 
-    with open(os.path.join(output_path, "conf.py"), "w") as f:
-        for k, v in conf.items():
-            f.write("%s = %s\n" % (k, repr(v)))
+    write_if_changed(os.path.join(output_path, "conf.py"), "".join("%s = %s\n" % (k, repr(v)) for k, v in conf.items()))
 
-    with open(os.path.join(output_path, "index.rst"), "w") as f:
-        f.write(
-            """
-Packages
-========
+    summaries = read_package_summaries(output_path, package_names)
 
-.. toctree::
-    :titlesonly:
-    :maxdepth: 1
-    :glob:
-
-    */index
-"""
-        )
+    lines = ["", "Packages", "========", "", ".. raw:: html", ""]
+    lines.extend("    " + line for line in SEARCH_BOX_HTML.splitlines())
+    lines.extend(["", ".. toctree::", "    :hidden:", "    :titlesonly:", "    :maxdepth: 1", ""])
+    lines.extend("    %s/index" % summary["name"] for summary in summaries)
+    lines.extend(["", ".. raw:: html", ""])
+    lines.extend("    " + line for line in package_list_html(summaries))
+    write_if_changed(os.path.join(output_path, "index.rst"), "\n".join(lines) + "\n")
     return 0
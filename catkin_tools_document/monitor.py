@@ -0,0 +1,294 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import signal
+import time
+
+from osrf_pycommon.process_utils import get_loop
+
+from catkin_tools.execution.events import ExecutionEvent
+from catkin_tools.execution.io import IOBufferProtocol
+
+# Seconds between samples of a running command's memory use.
+SAMPLE_INTERVAL = 0.5
+
+# Seconds between checks of a running command against its timeouts.
+WATCHDOG_INTERVAL = 1.0
+
+# rosdoc.yaml builder keys which override the run's timeouts for that builder's commands, in seconds.
+STAGE_LIMIT_KEYS = ("timeout", "stall_timeout")
+
+# Terminal control sequences, which sphinx uses to redraw its progress line.
+_ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+
+def _child_pids(pid):
+    try:
+        with open("/proc/%d/task/%d/children" % (pid, pid)) as f:
+            return [int(p) for p in f.read().split()]
+    except (OSError, ValueError):
+        return []
+
+
+def _peak_rss_kb(pid):
+    try:
+        with open("/proc/%d/status" % pid) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def process_tree_pids(pid):
+    """A process and its descendants, parents first; just the process where /proc isn't available."""
+    pids = [pid]
+    for parent in pids:
+        pids.extend(_child_pids(parent))
+    return pids
+
+
+def process_tree_peak_rss_kb(pid):
+    """Sum of the peak resident set sizes of a process and its descendants, or 0 where /proc isn't available."""
+    return sum(_peak_rss_kb(p) for p in process_tree_pids(pid))
+
+
+class ProgressParser(object):
+    """Tracks a command's progress from its output, one line at a time.
+
+    Subclasses update items (units of work done, for throughput) and fraction (0 to 1, or None while
+    it can't be known) in parse_line. expected_items is the number of items the same stage did the
+    last time it ran, if known.
+    """
+
+    def __init__(self, expected_items=None):
+        self.expected_items = expected_items
+        self.items = 0
+        self.fraction = None
+
+    def parse_line(self, line):
+        raise NotImplementedError()
+
+
+class SphinxProgressParser(ProgressParser):
+    """Progress of sphinx-build, from its "reading sources... [ 42%]" and "writing output... [ 42%]" lines.
+
+    Reading and writing are counted as half of the build each. Items are the source files read.
+    """
+
+    _STATUS = re.compile(r"(reading sources|writing output)\.\.\. \[\s*(\d+)%\]")
+
+    def parse_line(self, line):
+        match = self._STATUS.search(line)
+        if match is None:
+            return
+        phase, percent = match.groups()
+        if phase == "reading sources":
+            self.items += 1
+            self.fraction = int(percent) / 200.0
+        else:
+            self.fraction = 0.5 + int(percent) / 200.0
+
+
+class DoxygenProgressParser(ProgressParser):
+    """Progress of doxygen, from its "Parsing file" and "Generating docs for compound" lines.
+
+    Doxygen doesn't say how much is left, so the fraction is relative to the number of such lines of
+    the previous run, and stays unknown on the first.
+    """
+
+    _STATUS = re.compile(r"^(Parsing file|Generating docs for|Generating code for file) ")
+
+    def parse_line(self, line):
+        if self._STATUS.match(line) is None:
+            return
+        self.items += 1
+        if self.expected_items:
+            # Hold short of done until doxygen actually exits, in case this run does more than the last one.
+            self.fraction = min(self.items / float(self.expected_items), 0.99)
+
+
+# Stages whose command output is parsed for progress, by stage label.
+PROGRESS_PARSERS = {
+    "rosdoc_doxygen": DoxygenProgressParser,
+    "rosdoc_doxygen_tags": DoxygenProgressParser,
+    "rosdoc_sphinx": SphinxProgressParser,
+    "summary_sphinx": SphinxProgressParser,
+}
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return "%d:%02d" % (minutes, seconds) if minutes else "%ds" % seconds
+
+
+class MonitoredIOBufferProtocol(IOBufferProtocol):
+    """IOBufferProtocol which also watches the command it runs.
+
+    While the command runs, the peak RSS of its process tree is sampled, and if the stage has a
+    progress parser (see PROGRESS_PARSERS), its output is parsed into STAGE_PROGRESS events with an
+    estimate of the seconds remaining. When it exits, the peak RSS, items done and duration are
+    recorded in the history (see history.StageHistory), and the stage's throughput is logged.
+
+    A command which runs longer than timeout seconds, or goes stall_timeout seconds without any
+    output, is killed along with its descendants, which fails the stage.
+    """
+
+    def __init__(
+        self,
+        label,
+        job_id,
+        stage_label,
+        event_queue,
+        log_path,
+        history=None,
+        timeout=None,
+        stall_timeout=None,
+        *args,
+        **kwargs
+    ):
+        IOBufferProtocol.__init__(self, label, job_id, stage_label, event_queue, log_path, *args, **kwargs)
+        self.history = history
+        self.peak_rss_kb = 0
+        self._sample_handle = None
+        self._start_time = time.time()
+
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self.killed_reason = None
+        self._last_output_time = self._start_time
+        self._watchdog_handle = None
+
+        self.progress = None
+        self._last_percent = None
+        self._partial_lines = {}
+        parser_class = PROGRESS_PARSERS.get(stage_label)
+        if parser_class is not None:
+            expected_items = history.get(job_id, stage_label, "items") if history is not None else None
+            self.progress = parser_class(expected_items=expected_items)
+
+    def connection_made(self, transport):
+        IOBufferProtocol.connection_made(self, transport)
+        if self.history is not None:
+            self._sample_memory()
+        if self.timeout or self.stall_timeout:
+            self._watchdog_handle = get_loop().call_later(WATCHDOG_INTERVAL, self._check_timeouts)
+
+    def _sample_memory(self):
+        pid = self.transport.get_pid()
+        if pid is not None:
+            self.peak_rss_kb = max(self.peak_rss_kb, process_tree_peak_rss_kb(pid))
+        self._sample_handle = get_loop().call_later(SAMPLE_INTERVAL, self._sample_memory)
+
+    def _check_timeouts(self):
+        now = time.time()
+        if self.timeout and now - self._start_time > self.timeout:
+            self.kill("Killed after running for more than %s." % format_duration(self.timeout))
+        elif self.stall_timeout and now - self._last_output_time > self.stall_timeout:
+            self.kill("Killed after %s without any output." % format_duration(self.stall_timeout))
+        else:
+            self._watchdog_handle = get_loop().call_later(WATCHDOG_INTERVAL, self._check_timeouts)
+
+    def kill(self, reason):
+        """Kill the command and everything it started, eg, the dot processes of doxygen."""
+        self.killed_reason = reason
+        self._watchdog_handle = None
+        IOBufferProtocol.on_stderr_received(self, ("%s\n" % reason).encode())
+        pid = self.transport.get_pid()
+        if pid is not None:
+            for descendant in process_tree_pids(pid)[1:]:
+                try:
+                    os.kill(descendant, signal.SIGKILL)
+                except OSError:
+                    pass
+        self.transport.kill()
+
+    def _parse_progress(self, stream, data):
+        # Lines are parsed from the raw output as it arrives, since progress lines often end in a
+        # carriage return rather than a newline, and so wouldn't reach the output buffers until much later.
+        text = self._partial_lines.get(stream, "") + self._decode(data)
+        lines = re.split(r"[\r\n]", _ANSI_ESCAPE.sub("", text))
+        self._partial_lines[stream] = lines.pop()
+        for line in lines:
+            self.progress.parse_line(line)
+
+        if self.progress.fraction is None:
+            return
+        percent = int(100 * self.progress.fraction)
+        if percent == self._last_percent:
+            return
+        self._last_percent = percent
+        eta = None
+        if self.progress.fraction > 0:
+            eta = (time.time() - self._start_time) * (1 - self.progress.fraction) / self.progress.fraction
+        self.event_queue.put(
+            ExecutionEvent(
+                "STAGE_PROGRESS", job_id=self.job_id, stage_label=self.stage_label, percent=str(percent), eta=eta
+            )
+        )
+
+    def on_stdout_received(self, data):
+        self._last_output_time = time.time()
+        if self.progress is not None:
+            self._parse_progress("stdout", data)
+        IOBufferProtocol.on_stdout_received(self, data)
+
+    def on_stderr_received(self, data):
+        self._last_output_time = time.time()
+        if self.progress is not None:
+            self._parse_progress("stderr", data)
+        IOBufferProtocol.on_stderr_received(self, data)
+
+    def process_exited(self):
+        if self._sample_handle is not None:
+            self._sample_handle.cancel()
+            self._sample_handle = None
+        if self._watchdog_handle is not None:
+            self._watchdog_handle.cancel()
+            self._watchdog_handle = None
+        duration = time.time() - self._start_time
+        metrics = {"duration": round(duration, 3)}
+        if self.peak_rss_kb:
+            metrics["peak_rss_kb"] = self.peak_rss_kb
+        if self.progress is not None and self.progress.items:
+            metrics["items"] = self.progress.items
+            throughput = "%d items in %s (%.1f/s)\n" % (
+                self.progress.items,
+                format_duration(duration),
+                self.progress.items / max(duration, 0.001),
+            )
+            IOBufferProtocol.on_stdout_received(self, throughput.encode())
+        if self.history is not None:
+            self.history.record(self.job_id, self.stage_label, **metrics)
+        IOBufferProtocol.process_exited(self)
+
+    @classmethod
+    def factory_with(cls, **options):
+        """Logger factory for CommandStage, like IOBufferProtocol.factory but binding the monitoring options.
+
+        The options stay readable as the factory's options attribute, so they can be extended later.
+        """
+
+        def factory(label, job_id, stage_label, event_queue, log_path):
+            def init_proxy(*args, **kwargs):
+                kwargs.update(options)
+                return cls(label, job_id, stage_label, event_queue, log_path, *args, **kwargs)
+
+            return init_proxy
+
+        factory.options = options
+        return factory
@@ -0,0 +1,58 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from html import escape
+
+import os
+import shutil
+
+from catkin_tools.common import mkdir_p
+
+REDOC_SCRIPT_URL = "https://cdn.redoc.ly/redoc/latest/bundles/redoc.standalone.js"
+
+_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+</head>
+<body>
+<redoc spec-url="{spec}"></redoc>
+<script src="{script}"></script>
+</body>
+</html>
+"""
+
+
+def write_openapi_page(logger, event_queue, spec_path: str, output_dir: str, title: str) -> int:
+    """
+    FunctionStage functor that publishes an OpenAPI spec without any local tooling: the spec is
+    copied to the output directory, next to an index.html which renders it in the browser with Redoc.
+
+    :param logger:
+    :param event_queue:
+    :param spec_path: OpenAPI (or Swagger) spec, YAML or JSON
+    :param output_dir: HTML output directory
+    :param title: Page title
+    :return: return code
+    """
+    if not os.path.isfile(spec_path):
+        logger.err("OpenAPI spec %s does not exist." % spec_path)
+        return 1
+    mkdir_p(output_dir)
+    spec_filename = os.path.basename(spec_path)
+    shutil.copyfile(spec_path, os.path.join(output_dir, spec_filename))
+    with open(os.path.join(output_dir, "index.html"), "w") as f:
+        f.write(_PAGE.format(title=escape(title), spec=escape(spec_filename), script=REDOC_SCRIPT_URL))
+    return 0
@@ -0,0 +1,322 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from html import escape
+
+import ast
+import hashlib
+import json
+import os
+
+from catkin_tools.common import mkdir_p
+from catkin_tools.execution.events import ExecutionEvent
+
+from .assets import COMPRESSION_FORMATS
+from .inventory import write_inventory
+from .pyworker import submit
+from .util import write_if_changed
+
+# Bump when the extracted data changes shape, to invalidate cached extractions.
+_EXTRACTOR_VERSION = 1
+
+
+def _unparse(node):
+    if node is None:
+        return None
+    try:
+        return ast.unparse(node)
+    except AttributeError:
+        # Python < 3.9
+        return "..."
+
+
+def _format_arguments(args):
+    parts = []
+    positional = list(getattr(args, "posonlyargs", [])) + list(args.args)
+    defaults = [None] * (len(positional) - len(args.defaults)) + list(args.defaults)
+    for index, (arg, default) in enumerate(zip(positional, defaults)):
+        parts.append(_format_arg(arg, default))
+        if index + 1 == len(getattr(args, "posonlyargs", [])):
+            parts.append("/")
+    if args.vararg is not None:
+        parts.append("*" + _format_arg(args.vararg))
+    elif args.kwonlyargs:
+        parts.append("*")
+    for arg, default in zip(args.kwonlyargs, args.kw_defaults):
+        parts.append(_format_arg(arg, default))
+    if args.kwarg is not None:
+        parts.append("**" + _format_arg(args.kwarg))
+    return ", ".join(parts)
+
+
+def _format_arg(arg, default=None):
+    text = arg.arg
+    if arg.annotation is not None:
+        text += ": " + _unparse(arg.annotation)
+    if default is not None:
+        text += "=" + _unparse(default)
+    return text
+
+
+def _function_info(node):
+    signature = "(%s)" % _format_arguments(node.args)
+    if node.returns is not None:
+        signature += " -> " + _unparse(node.returns)
+    return {
+        "name": node.name,
+        "signature": signature,
+        "doc": ast.get_docstring(node),
+        "lineno": node.lineno,
+        "is_async": isinstance(node, ast.AsyncFunctionDef),
+    }
+
+
+def extract_python_file(path):
+    """Signatures and docstrings of a module's classes and functions, as plain (JSON-serializable) data.
+
+    Module-level function so it can run on the worker pool.
+    """
+    with open(path, "rb") as f:
+        source = f.read()
+    try:
+        tree = ast.parse(source, filename=path)
+    except (SyntaxError, ValueError) as ex:
+        return {"version": _EXTRACTOR_VERSION, "error": str(ex), "doc": None, "classes": [], "functions": []}
+
+    info = {"version": _EXTRACTOR_VERSION, "doc": ast.get_docstring(tree), "classes": [], "functions": []}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            info["functions"].append(_function_info(node))
+        elif isinstance(node, ast.ClassDef):
+            info["classes"].append(
+                {
+                    "name": node.name,
+                    "bases": [_unparse(base) for base in node.bases],
+                    "doc": ast.get_docstring(node),
+                    "lineno": node.lineno,
+                    "methods": [
+                        _function_info(child)
+                        for child in node.body
+                        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef))
+                    ],
+                }
+            )
+    return info
+
+
+def _find_python_files(src_dir):
+    for dirpath, dirnames, filenames in os.walk(src_dir):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith(".") and d != "__pycache__")
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                yield os.path.join(dirpath, filename)
+
+
+def _module_name(src_dir, path):
+    parts = os.path.relpath(path, src_dir)[: -len(".py")].split(os.sep)
+    if parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts)
+
+
+def _is_public(name, include_private):
+    return include_private or not name.startswith("_") or name == "__init__"
+
+
+_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; max-width: 60em; margin: 2em auto; }}
+dt {{ font-family: monospace; font-weight: bold; margin-top: 1em; }}
+pre.doc {{ font-family: inherit; white-space: pre-wrap; }}
+dl dl {{ margin-left: 2em; }}
+</style>
+</head>
+<body>
+<p><a href="index.html">{package} Python API</a></p>
+<h1>{title}</h1>
+{body}
+</body>
+</html>
+"""
+
+
+def _doc_html(doc):
+    return '<pre class="doc">%s</pre>' % escape(doc) if doc else ""
+
+
+def _function_html(anchor, info):
+    return '<dt id="%s">%s%s%s</dt><dd>%s</dd>\n' % (
+        escape(anchor),
+        "async " if info["is_async"] else "",
+        escape(info["name"]),
+        escape(info["signature"]),
+        _doc_html(info["doc"]),
+    )
+
+
+def _render_module(package_name, module_name, info, include_private):
+    """Module page HTML plus its inventory entries."""
+    page = module_name + ".html"
+    entries = [(module_name, "py:module", 0, page, module_name)]
+    body = [_doc_html(info["doc"]), "<dl>\n"]
+    for cls in info["classes"]:
+        if not _is_public(cls["name"], include_private):
+            continue
+        cls_name = "%s.%s" % (module_name, cls["name"])
+        entries.append((cls_name, "py:class", 1, "%s#%s" % (page, cls_name), cls_name))
+        bases = "(%s)" % ", ".join(cls["bases"]) if cls["bases"] else ""
+        body.append('<dt id="%s">class %s</dt><dd>' % (escape(cls_name), escape(cls["name"] + bases)))
+        body.append(_doc_html(cls["doc"]) + "<dl>\n")
+        for method in cls["methods"]:
+            if not _is_public(method["name"], include_private):
+                continue
+            method_name = "%s.%s" % (cls_name, method["name"])
+            entries.append((method_name, "py:method", 1, "%s#%s" % (page, method_name), method_name))
+            body.append(_function_html(method_name, method))
+        body.append("</dl></dd>\n")
+    for function in info["functions"]:
+        if not _is_public(function["name"], include_private):
+            continue
+        function_name = "%s.%s" % (module_name, function["name"])
+        entries.append((function_name, "py:function", 1, "%s#%s" % (page, function_name), function_name))
+        body.append(_function_html(function_name, function))
+    body.append("</dl>\n")
+    return _PAGE.format(title=escape(module_name), package=escape(package_name), body="".join(body)), entries
+
+
+def generate_python_api(
+    logger, event_queue, package_name, src_dir, output_dir, cache_dir, include_private=False
+) -> int:
+    """
+    FunctionStage functor which documents a package's Python modules from their source, without
+    importing them, and writes HTML pages plus an objects.inv for intersphinx.
+
+    Extraction results are cached per file, keyed on the content hash, and the hash itself is cached
+    against the file's mtime and size, so unchanged files are neither parsed nor read again. Files
+    which do need parsing are spread over the shared worker pool. Pages of modules which no longer
+    exist are removed, so they don't outlive their source.
+
+    :param logger:
+    :param event_queue:
+    :param package_name: Package being documented
+    :param src_dir: Root of the package's Python sources
+    :param output_dir: HTML output directory
+    :param cache_dir: Directory for cached extraction results
+    :param include_private: Whether to document names starting with an underscore
+    :return: return code
+    """
+    mkdir_p(output_dir)
+    mkdir_p(cache_dir)
+
+    index_path = os.path.join(cache_dir, "index.json")
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+
+    paths = list(_find_python_files(src_dir))
+    infos = {}
+    pending = {}
+    new_index = {}
+    for path in paths:
+        st = os.stat(path)
+        cached = index.get(path)
+        if cached is not None and cached[:2] == [st.st_mtime_ns, st.st_size]:
+            digest = cached[2]
+        else:
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        new_index[path] = [st.st_mtime_ns, st.st_size, digest]
+
+        cache_path = os.path.join(cache_dir, digest + ".json")
+        try:
+            with open(cache_path) as f:
+                infos[path] = json.load(f)
+            if infos[path].get("version") == _EXTRACTOR_VERSION:
+                continue
+        except (OSError, ValueError):
+            pass
+        pending[path] = (cache_path, submit(extract_python_file, path))
+
+    for count, (path, (cache_path, future)) in enumerate(pending.items()):
+        infos[path] = future.result()
+        with open(cache_path, "w") as f:
+            json.dump(infos[path], f)
+        event_queue.put(
+            ExecutionEvent(
+                "STAGE_PROGRESS",
+                job_id=logger.job_id,
+                stage_label=logger.stage_label,
+                percent=str(int(100 * count / float(len(pending)))),
+            )
+        )
+
+    # Drop cached extractions of files which no longer exist or have changed.
+    live = set(digest + ".json" for _, _, digest in new_index.values())
+    for filename in os.listdir(cache_dir):
+        if filename.endswith(".json") and filename not in ("index.json", "pages.json") and filename not in live:
+            os.unlink(os.path.join(cache_dir, filename))
+    with open(index_path, "w") as f:
+        json.dump(new_index, f)
+
+    logger.out("Parsed %d of %d Python files." % (len(pending), len(paths)))
+
+    entries = []
+    modules = []
+    pages = []
+    for path in paths:
+        module_name = _module_name(src_dir, path)
+        if not module_name:
+            continue
+        info = infos[path]
+        if info.get("error"):
+            logger.err("Could not parse %s: %s" % (path, info["error"]))
+        page, module_entries = _render_module(package_name, module_name, info, include_private)
+        write_if_changed(os.path.join(output_dir, module_name + ".html"), page)
+        pages.append(module_name + ".html")
+        entries.extend(module_entries)
+        summary = (info["doc"] or "").strip().split("\n", 1)[0]
+        modules.append('<li><a href="%s.html">%s</a> %s</li>\n' % (module_name, module_name, escape(summary)))
+
+    index_page = _PAGE.format(
+        title="%s Python API" % escape(package_name),
+        package=escape(package_name),
+        body="<ul>\n%s</ul>\n" % "".join(modules),
+    )
+    write_if_changed(os.path.join(output_dir, "index.html"), index_page)
+    write_inventory(os.path.join(output_dir, "objects.inv"), package_name, "", entries)
+
+    # Remove the pages of modules which were removed or renamed since the last build. Only pages this
+    # stage wrote are considered, as the output directory may be shared with other builders.
+    pages_path = os.path.join(cache_dir, "pages.json")
+    try:
+        with open(pages_path) as f:
+            stale_pages = set(json.load(f)) - set(pages)
+    except (OSError, ValueError):
+        stale_pages = set()
+    for page in sorted(stale_pages):
+        page_path = os.path.join(output_dir, page)
+        for path in [page_path] + ["%s.%s" % (page_path, fmt) for fmt in COMPRESSION_FORMATS]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+    with open(pages_path, "w") as f:
+        json.dump(pages, f)
+    return 0
@@ -0,0 +1,97 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import atexit
+import contextlib
+import io
+import multiprocessing
+import os
+import threading
+import traceback
+
+from catkin_tools.execution import job_server
+
+# pydoctor's exit code when some docstrings couldn't be parsed; the docs are still complete.
+PYDOCTOR_DOCSTRING_ERRORS = 2
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _run_pydoctor(args, cwd):
+    """Runs in a worker process: one pydoctor invocation, returning its exit code and output."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        try:
+            from pydoctor.driver import main
+
+            os.chdir(cwd)
+            retcode = main(args)
+        except SystemExit as ex:
+            retcode = ex.code if isinstance(ex.code, int) else 1
+        except Exception:
+            traceback.print_exc()
+            retcode = 1
+    return retcode, output.getvalue()
+
+
+def _get_pool():
+    """Pool of long-lived Python workers, shared by all packages for the life of the process.
+
+    Workers keep pydoctor imported between packages, so only the first package pays the interpreter
+    and import startup. They're spawned rather than forked, since the parent runs an event loop and
+    several threads.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            max_workers = job_server.max_jobs() if job_server.initialized() else None
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def submit(fn, *args):
+    """Run a picklable, module-level function on the shared worker pool, returning its Future."""
+    return _get_pool().submit(fn, *args)
+
+
+def run_pydoctor(logger, event_queue, args: List[str], cwd: str, output_dir: str) -> int:
+    """
+    FunctionStage functor that runs pydoctor on a persistent worker process.
+
+    Docstring syntax errors are reported but don't fail the stage; anything else pydoctor
+    fails with (including producing no objects.inv for other packages to link against) does.
+
+    :param logger:
+    :param event_queue:
+    :param args: pydoctor command line arguments, without the executable
+    :param cwd: Working directory for the run
+    :param output_dir: pydoctor's HTML output directory
+    :return: return code
+    """
+    retcode, output = submit(_run_pydoctor, args, cwd).result()
+    for line in output.splitlines():
+        logger.out(line)
+
+    if retcode == PYDOCTOR_DOCSTRING_ERRORS:
+        logger.err("pydoctor could not parse some docstrings, see the messages above.")
+        retcode = 0
+    elif retcode == 0 and not os.path.isfile(os.path.join(output_dir, "objects.inv")):
+        logger.err("pydoctor did not write an objects.inv to %s." % output_dir)
+        retcode = 1
+    return retcode
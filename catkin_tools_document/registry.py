@@ -0,0 +1,121 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from functools import lru_cache
+
+import glob
+import hashlib
+import importlib.metadata
+import json
+import os
+import sys
+
+# Entry point group of rosdoc builders. Each entry point's name is the builder name used in
+# rosdoc.yaml, and it loads a description dict with these keys:
+#
+#   name:          Name of the builder when it's registered under several, eg, "openapi" for "swagger"
+#                  too. Its files in the docs build space are named after it, see builder_name.
+#   create_stages: callable(conf, package, deps, doc_deps, output_path, source_path, docs_build_path,
+#                  job_env, toolchain) returning the builder's stages for one package. The run's
+#                  toolchain.Toolchain gives the paths of the builder's tools, None if not installed.
+#   defaults:      Values of the builder's rosdoc.yaml keys when a package doesn't give them.
+#   inputs:        Globs of the files which the builder reads.
+#   outputs:       Directories which the builder writes.
+#   inventories:   Map of inventory format ("objects.inv", "doxygen_tags") to the file the builder
+#                  writes in it, for other packages to link against.
+#   cost:          Expected cost relative to other builders, about 1 for a small Python package.
+#   schema:        Map of the builder's own rosdoc.yaml keys to their type, or tuple of types, which
+#                  configurations are validated against, see config.validate_rosdoc_conf.
+#   tools:         Commands (or Python modules, see toolchain.PYTHON_TOOLS) the builder can't run
+#                  without; documenting fails up front if one is missing. A tuple of tools is
+#                  satisfied by any one of them, eg, ("epydoc", "pydoctor").
+#   optional_tools: Tools the builder uses when they're installed, and does without otherwise.
+#   standalone:    Whether the builder is independent of the package's other builders and of other
+#                  packages' docs, so that it runs as a job of its own, in parallel with them, and
+#                  only when its inputs changed since it last succeeded. Its output_dir can't be
+#                  shared with another builder of the package, so it should default to its own.
+#
+# Paths may refer to {source_path}, {docs_path} and {docs_build_path} of the package, and to any of
+# the builder's rosdoc.yaml keys, eg, {output_dir}. See expand_builder_paths.
+BUILDERS_GROUP = "catkin_tools_document.builders"
+
+DEFAULT_BUILDER_COST = 1
+
+
+def _entry_points(group):
+    if sys.version_info >= (3, 10):
+        return importlib.metadata.entry_points(group=group)
+    # Before Python 3.10, entry points come as a map of group to a list of them.
+    return importlib.metadata.entry_points().get(group, [])
+
+
+@lru_cache(maxsize=None)
+def load_builders():
+    """Map each registered builder's name to its description."""
+    return dict((ep.name, ep.load()) for ep in _entry_points(BUILDERS_GROUP))
+
+
+def expand_builder_paths(patterns, description, conf, source_path, docs_path, docs_build_path):
+    """Substitute a package's paths and builder configuration into a builder's path patterns."""
+    values = dict(description.get("defaults", {}))
+    values.update(conf)
+    values.update(source_path=source_path, docs_path=docs_path, docs_build_path=docs_build_path)
+    return [pattern.format(**values) for pattern in patterns]
+
+
+def builder_name(builder, builders=None):
+    """Name which the files of a builder, given by any of its registered names, are named after."""
+    return (builders if builders is not None else load_builders()).get(builder, {}).get("name", builder)
+
+
+def builder_output_dir(conf, builders=None):
+    """Output directory of a builder configuration, relative to the package's html directory."""
+    description = (builders if builders is not None else load_builders()).get(conf.get("builder"), {})
+    return conf.get("output_dir", description.get("defaults", {}).get("output_dir", ""))
+
+
+def builder_cost(rosdoc_conf):
+    """Expected cost of a package's job with the given builder configurations, not counting standalone builders."""
+    builders = load_builders()
+    return sum(
+        builders[conf["builder"]].get("cost", DEFAULT_BUILDER_COST)
+        for conf in rosdoc_conf
+        if conf["builder"] in builders and not builders[conf["builder"]].get("standalone")
+    )
+
+
+def builder_tools(description):
+    """All the tools a builder may use, required or optional, with alternatives listed one by one."""
+    tools = []
+    for tool in description.get("tools", []) + description.get("optional_tools", []):
+        tools.extend(tool if isinstance(tool, tuple) else [tool])
+    return tools
+
+
+def input_fingerprint(description, conf, source_path, docs_path, docs_build_path, toolchain=None):
+    """Hash of a builder's configuration, of the paths, sizes and mtimes of its input files and, given
+    the run's toolchain, of the paths and versions of the builder's tools."""
+    h = hashlib.sha256(json.dumps(conf, sort_keys=True, default=str).encode())
+    if toolchain is not None:
+        h.update(toolchain.fingerprint(builder_tools(description)).encode())
+    # Packages can list extra inputs of their own, relative to the package, eg, files a spec refers to.
+    input_patterns = description.get("inputs", []) + ["{source_path}/" + p for p in conf.get("inputs", [])]
+    patterns = expand_builder_paths(input_patterns, description, conf, source_path, docs_path, docs_build_path)
+    paths = set()
+    for pattern in patterns:
+        paths.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+    for path in sorted(paths):
+        st = os.stat(path)
+        h.update(("%s\0%d\0%d\n" % (path, st.st_size, st.st_mtime_ns)).encode())
+    return h.hexdigest()
@@ -0,0 +1,156 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncio
+
+from catkin_tools.execution import job_server
+from catkin_tools.execution.events import ExecutionEvent
+from catkin_tools.execution.executor import async_job
+
+# Seconds between looks for jobs to start while nothing finishes.
+SCHEDULER_INTERVAL = 0.1
+
+
+def _split(values, cond):
+    return [v for v in values if cond(v)], [v for v in values if not cond(v)]
+
+
+async def execute_jobs(
+    verb,
+    jobs,
+    locks,
+    event_queue,
+    log_path,
+    max_toplevel_jobs=None,
+    continue_on_failure=False,
+    continue_without_deps=False,
+    admit=None,
+):
+    """Process jobs like catkin_tools' execute_jobs does, but only start a ready job once admit(job) is true.
+
+    A job which isn't admitted yet stays queued, holding neither a job slot nor a thread of the pool
+    which FunctionStages run on, and the queued jobs behind it may start first. This is how jobs wait
+    for what isn't a job of this run, eg, memory or other shards, without starving the jobs which
+    would free it. admit is called on the executor's thread, and may reserve whatever it admits a job
+    against; an EventQueue listener can give it back on FINISHED_JOB.
+
+    :param admit: Callable taking a queued Job, returning whether it may start now
+    :returns: Whether all jobs completed and succeeded
+    """
+    job_map = dict((job.jid, job) for job in jobs)
+    completed_jobs = {}
+    abandoned_jobs = []
+    active_jobs = []
+    active_job_fs = set()
+
+    if not job_server.initialized():
+        raise RuntimeError("JobServer has not been initialized.")
+
+    threadpool = ThreadPoolExecutor(max_workers=job_server.max_jobs())
+
+    pending_jobs, missing_deps_jobs = _split(jobs, lambda job: all(dep in job_map for dep in job.deps))
+    for job in missing_deps_jobs:
+        abandoned_jobs.append(job)
+        event_queue.put(
+            ExecutionEvent(
+                "ABANDONED_JOB",
+                job_id=job.jid,
+                reason="MISSING_DEPS",
+                dep_ids=[dep for dep in job.deps if dep not in job_map],
+            )
+        )
+    queued_jobs, pending_jobs = _split(pending_jobs, lambda job: len(job.deps) == 0)
+
+    def abandon(job, **data):
+        abandoned_jobs.append(job)
+        event_queue.put(ExecutionEvent("ABANDONED_JOB", job_id=job.jid, **data))
+
+    while active_job_fs or queued_jobs or pending_jobs:
+        # Start the first admitted jobs in queue order while there are slots and job server tokens.
+        while queued_jobs and (max_toplevel_jobs is None or len(active_jobs) < max_toplevel_jobs):
+            if job_server.try_acquire() is None:
+                break
+            job = next((job for job in queued_jobs if admit is None or admit(job)), None)
+            if job is None:
+                job_server.release()
+                break
+            queued_jobs.remove(job)
+            job_server.add_label(job.jid)
+            event_queue.put(ExecutionEvent("STARTED_JOB", job_id=job.jid))
+            active_jobs.append(job)
+            active_job_fs.add(asyncio.ensure_future(async_job(verb, job, threadpool, locks, event_queue, log_path)))
+
+        event_queue.put(
+            ExecutionEvent(
+                "JOB_STATUS",
+                pending=[job.jid for job in pending_jobs],
+                queued=[job.jid for job in queued_jobs],
+                active=[job.jid for job in active_jobs],
+                abandoned=[job.jid for job in abandoned_jobs],
+                completed=completed_jobs,
+            )
+        )
+
+        if not active_job_fs:
+            # Everything that's left is waiting to be admitted.
+            await asyncio.sleep(SCHEDULER_INTERVAL)
+            continue
+        done_job_fs, active_job_fs = await asyncio.wait(
+            active_job_fs, timeout=SCHEDULER_INTERVAL, return_when=FIRST_COMPLETED
+        )
+
+        for done_job_f in done_job_fs:
+            job_id, succeeded = await done_job_f
+            job_server.release(job_id)
+            active_jobs = [job for job in active_jobs if job.jid != job_id]
+            event_queue.put(ExecutionEvent("FINISHED_JOB", job_id=job_id, succeeded=succeeded))
+            completed_jobs[job_id] = succeeded
+
+            if not succeeded:
+                if not continue_on_failure:
+                    for job in queued_jobs + pending_jobs:
+                        abandon(job, reason="PEER_FAILED", peer_job_id=job_id)
+                    queued_jobs = []
+                    pending_jobs = []
+                elif not continue_without_deps:
+                    unhandled_job_ids = [job_id]
+                    while unhandled_job_ids:
+                        abandoned_job_id = unhandled_job_ids.pop(0)
+                        dependents, pending_jobs = _split(pending_jobs, lambda job: abandoned_job_id in job.deps)
+                        for job in dependents:
+                            abandon(job, reason="DEP_FAILED", direct_dep_job_id=abandoned_job_id, dep_job_id=job_id)
+                        unhandled_job_ids.extend(job.jid for job in dependents)
+
+            new_queued_jobs, pending_jobs = _split(pending_jobs, lambda job: job.all_deps_completed(completed_jobs))
+            # Queued jobs keep the order they were given in.
+            queued = set(new_queued_jobs).union(queued_jobs)
+            queued_jobs = [job for job in jobs if job in queued]
+            for job in new_queued_jobs:
+                event_queue.put(ExecutionEvent("QUEUED_JOB", job_id=job.jid))
+
+    event_queue.put(
+        ExecutionEvent(
+            "JOB_STATUS",
+            pending=[job.jid for job in pending_jobs],
+            queued=[job.jid for job in queued_jobs],
+            active=[job.jid for job in active_jobs],
+            abandoned=[job.jid for job in abandoned_jobs],
+            completed=completed_jobs,
+        )
+    )
+    threadpool.shutdown(wait=False)
+    return all(completed_jobs.values()) and len(abandoned_jobs) == 0
@@ -0,0 +1,271 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import List
+
+import json
+import os
+import re
+
+from .assets import COMPRESSION_FORMATS
+from .doxygen import DOXYGEN_SYMBOLS_FILE
+from .inventory import read_inventory
+from .registry import builder_name
+from .registry import load_builders
+from .summary import read_package_summaries
+from .util import output_dir_file
+from .util import write_if_changed
+
+# Directory of the index in the docs space, and the page snippet which puts a search box on a page there.
+SEARCH_DIR = "_search"
+SEARCH_BOX_HTML = '<div id="workspace-search"></div>\n<script src="_search/search.js"></script>\n'
+
+# Entries are sharded by the first characters of their names, so the browser only fetches the shard
+# of what is being typed.
+PREFIX_LENGTH = 2
+
+# The manifest and shards are scripts which pass their data to this function, rather than JSON, as
+# browsers refuse to fetch() from file:// URLs, which is how local docs are usually opened.
+SEARCH_CALLBACK = "catkinDocumentSearch"
+
+# Inventory roles too noisy to be worth indexing: every section heading is a label.
+SKIPPED_INVENTORY_ROLES = ("std:label", "std:term")
+
+_NAME_SEPARATORS = re.compile(r"::|[./]")
+
+
+def _inventory_entries(inventory_path, base_uri):
+    entries = []
+    for name, domain_role, _, uri, _ in read_inventory(inventory_path):
+        if domain_role not in SKIPPED_INVENTORY_ROLES:
+            entries.append((name, domain_role.split(":", 1)[1], "%s/%s" % (base_uri, uri)))
+    return entries
+
+
+def _message_entries(summary):
+    package_name = summary["name"]
+    return [
+        ("%s/%s" % (package_name, name), subdir, "%s/%s/%s.html" % (package_name, subdir, name))
+        for subdir in ("msg", "srv")
+        for name in summary.get(subdir, [])
+    ]
+
+
+def _prefix(text):
+    return re.sub("[^a-z0-9]", "_", text[:PREFIX_LENGTH].lower()).ljust(PREFIX_LENGTH, "_")
+
+
+def _keys(name):
+    """Shards an entry is found in: those of its full name and of its last component, eg, "Bar" of "foo::Bar"."""
+    return set((_prefix(name), _prefix(_NAME_SEPARATORS.split(name)[-1])))
+
+
+def _jsonp(name, data):
+    return "%s(%s,%s);\n" % (SEARCH_CALLBACK, json.dumps(name), json.dumps(data, separators=(",", ":")))
+
+
+def build_search_index(logger, event_queue, docs_space: str, docs_build_space: str, package_names: List[str]) -> int:
+    """
+    FunctionStage functor that merges the search data of every documented package into one index for the
+    whole workspace, served with the top-level page: doxygen symbols from the symbol table which
+    generate_doxygen_inventory writes, Sphinx, pydoctor and pyast symbols from their objects.inv, and
+    the package's messages and services.
+
+    The index is sharded by name prefix into SEARCH_DIR, with a manifest listing the shards, so the
+    browser loads only what a query needs. Shards are JSONP scripts, see SEARCH_CALLBACK, so that
+    search works in docs opened from the filesystem as well as served ones. Unchanged shards aren't
+    rewritten.
+
+    :param logger:
+    :param event_queue:
+    :param docs_space: Root of the docs space
+    :param docs_build_space: Root of the docs build space
+    :param package_names: Packages to index
+    :return: return code
+    """
+    # Doxygen's symbols are indexed from its symbol table, which keeps their doxygen kinds, eg, struct.
+    builders = load_builders()
+    inventory_builders = sorted(
+        set(
+            builder_name(name, builders)
+            for name, desc in builders.items()
+            if "objects.inv" in desc.get("inventories", {}) and name != "doxygen"
+        )
+    )
+
+    entries = []
+    for package_name in sorted(package_names):
+        package_build_path = os.path.join(docs_build_space, package_name)
+
+        doxygen_marker = os.path.join(package_build_path, output_dir_file("doxygen"))
+        symbols_path = os.path.join(package_build_path, DOXYGEN_SYMBOLS_FILE)
+        if os.path.isfile(doxygen_marker) and os.path.isfile(symbols_path):
+            with open(doxygen_marker) as f:
+                html_dir = os.path.relpath(f.read().strip(), docs_space).replace(os.sep, "/")
+            with open(symbols_path) as f:
+                entries.extend(
+                    (name, kind, package_name, "%s/%s" % (html_dir, uri)) for name, kind, uri in json.load(f)
+                )
+
+        for builder in inventory_builders:
+            marker = os.path.join(package_build_path, output_dir_file(builder))
+            if not os.path.isfile(marker):
+                continue
+            with open(marker) as f:
+                output_dir = f.read().strip()
+            inventory_path = os.path.join(output_dir, "objects.inv")
+            if os.path.isfile(inventory_path):
+                base_uri = os.path.relpath(output_dir, docs_space).replace(os.sep, "/")
+                entries.extend(
+                    (name, kind, package_name, uri) for name, kind, uri in _inventory_entries(inventory_path, base_uri)
+                )
+
+    for summary in read_package_summaries(docs_build_space, package_names):
+        entries.extend((name, kind, summary["name"], uri) for name, kind, uri in _message_entries(summary))
+
+    # Kinds and packages are stored once in the manifest and referred to by index from the entries.
+    kinds = sorted(set(kind for _, kind, _, _ in entries))
+    packages = sorted(set(package for _, _, package, _ in entries))
+    kind_index = dict((kind, i) for i, kind in enumerate(kinds))
+    package_index = dict((package, i) for i, package in enumerate(packages))
+
+    shards = {}
+    for name, kind, package, uri in sorted(set(entries)):
+        for key in _keys(name):
+            shards.setdefault(key, []).append([name, kind_index[kind], package_index[package], uri])
+
+    search_path = os.path.join(docs_space, SEARCH_DIR)
+    if not os.path.isdir(search_path):
+        os.makedirs(search_path)
+    for key, shard in shards.items():
+        write_if_changed(os.path.join(search_path, key + ".js"), _jsonp(key, shard))
+    # Drop shards which are gone, the JSON ones of earlier versions, and their compressed siblings.
+    for filename in os.listdir(search_path):
+        source, ext = os.path.splitext(filename)
+        if ext[1:] not in COMPRESSION_FORMATS:
+            source = filename
+        name, ext = os.path.splitext(source)
+        if ext == ".json" or (ext == ".js" and name not in shards and source not in ("manifest.js", "search.js")):
+            os.unlink(os.path.join(search_path, filename))
+
+    manifest = dict(prefix_length=PREFIX_LENGTH, kinds=kinds, packages=packages, shards=sorted(shards))
+    write_if_changed(os.path.join(search_path, "manifest.js"), _jsonp("manifest", manifest))
+    write_if_changed(os.path.join(search_path, "search.js"), _SEARCH_JS % dict(callback=SEARCH_CALLBACK))
+
+    logger.out("Indexed %d symbols of %d packages in %d shards." % (len(set(entries)), len(packages), len(shards)))
+    return 0
+
+
+_SEARCH_JS = """// Workspace-wide symbol search, written by catkin document. Shards are loaded as they're needed, as
+// scripts rather than with fetch(), so that search also works in docs opened from file:// URLs.
+(function () {
+  var base = document.currentScript.src.replace(/[^\\/]*$/, "");
+  var root = base.replace(/_search\\/$/, "");
+  var manifest = null;
+  var shards = {};
+  var pending = {};
+  var maxResults = 50;
+
+  window.%(callback)s = function (name, data) {
+    if (pending[name]) {
+      pending[name](data);
+      delete pending[name];
+    }
+  };
+
+  function loadScript(name) {
+    return new Promise(function (resolve, reject) {
+      pending[name] = resolve;
+      var script = document.createElement("script");
+      script.src = base + name + ".js";
+      script.onerror = function () {
+        delete pending[name];
+        reject(new Error("Could not load " + script.src));
+      };
+      document.head.appendChild(script);
+    });
+  }
+
+  function prefix(text) {
+    return text.slice(0, manifest.prefix_length).toLowerCase().replace(/[^a-z0-9]/g, "_")
+      .padEnd(manifest.prefix_length, "_");
+  }
+
+  function shard(key) {
+    if (manifest.shards.indexOf(key) < 0) {
+      return Promise.resolve([]);
+    }
+    if (!shards[key]) {
+      shards[key] = loadScript(key);
+    }
+    return shards[key];
+  }
+
+  function lastComponent(name) {
+    var parts = name.split(/::|[.\\/]/);
+    return parts[parts.length - 1];
+  }
+
+  function search(query, results) {
+    query = query.trim().toLowerCase();
+    results.innerHTML = "";
+    if (query.length < manifest.prefix_length) {
+      return;
+    }
+    shard(prefix(query)).then(function (entries) {
+      var matches = entries.filter(function (entry) {
+        var name = entry[0].toLowerCase();
+        return name.indexOf(query) === 0 || lastComponent(name).indexOf(query) === 0;
+      });
+      matches.sort(function (a, b) {
+        var exactA = lastComponent(a[0]).toLowerCase() === query ? 0 : 1;
+        var exactB = lastComponent(b[0]).toLowerCase() === query ? 0 : 1;
+        return exactA - exactB || a[0].length - b[0].length || (a[0] < b[0] ? -1 : 1);
+      });
+      results.innerHTML = "";
+      matches.slice(0, maxResults).forEach(function (entry) {
+        var item = document.createElement("li");
+        var link = document.createElement("a");
+        link.href = root + entry[3];
+        link.textContent = entry[0];
+        item.appendChild(link);
+        item.appendChild(document.createTextNode(
+          " (" + manifest.kinds[entry[1]] + ", " + manifest.packages[entry[2]] + ")"));
+        results.appendChild(item);
+      });
+    });
+  }
+
+  var container = document.getElementById("workspace-search");
+  if (!container) {
+    return;
+  }
+  var input = document.createElement("input");
+  input.type = "search";
+  input.placeholder = "Search symbols, messages and services of all packages";
+  input.style.width = "100%%";
+  var results = document.createElement("ul");
+  container.appendChild(input);
+  container.appendChild(results);
+
+  var timer = null;
+  input.addEventListener("input", function () {
+    clearTimeout(timer);
+    timer = setTimeout(function () {
+      var load = manifest ? Promise.resolve() : loadScript("manifest").then(function (m) { manifest = m; });
+      load.then(function () { search(input.value, results); });
+    }, 150);
+  });
+})();
+"""
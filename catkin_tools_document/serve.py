@@ -0,0 +1,176 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from functools import partial
+from http.server import SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import os
+import posixpath
+import threading
+
+try:
+    # Python3
+    from queue import Queue
+except ImportError:
+    # Python2
+    from Queue import Queue
+
+from catkin_pkg.packages import find_packages
+
+from catkin_tools.common import get_cached_recursive_build_depends_in_workspace
+from catkin_tools.common import log
+from catkin_tools.common import mkdir_p
+from catkin_tools.terminal_color import fmt
+
+from .archive import DocsArchiveReader
+from .document import document_workspace
+
+
+class _BuildRequest(object):
+    def __init__(self, package_name):
+        self.package_name = package_name
+        self.done = threading.Event()
+
+
+class _DocsRequestHandler(SimpleHTTPRequestHandler):
+    """Serves the docs space, asking the build loop for a package's docs the first time they are requested."""
+
+    def __init__(self, *args, request_build=None, archive_reader=None, **kwargs):
+        self.request_build = request_build
+        self.archive_reader = archive_reader
+        super(_DocsRequestHandler, self).__init__(*args, **kwargs)
+
+    def _send_from_archive(self, send_body):
+        """Answer the request from the docs archives if the file isn't in the docs space."""
+        if self.archive_reader is None or os.path.exists(self.translate_path(self.path)):
+            return False
+        rel_path = posixpath.normpath(self.path.split("?", 1)[0].split("#", 1)[0])
+        if self.path.split("?", 1)[0].endswith("/"):
+            rel_path = posixpath.join(rel_path, "index.html")
+        data = self.archive_reader.read(rel_path)
+        if data is None:
+            return False
+        self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(rel_path))
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(data)
+        return True
+
+    def do_GET(self):
+        self.request_build(self.path.lstrip("/").split("/", 1)[0])
+        if not self._send_from_archive(send_body=True):
+            super(_DocsRequestHandler, self).do_GET()
+
+    def do_HEAD(self):
+        self.request_build(self.path.lstrip("/").split("/", 1)[0])
+        if not self._send_from_archive(send_body=False):
+            super(_DocsRequestHandler, self).do_HEAD()
+
+    def log_message(self, format, *args):
+        log("[document] [serve] %s" % (format % args))
+
+
+def serve_workspace(context, host="127.0.0.1", port=8000, **document_kwargs):
+    """Serve the docs space over HTTP, documenting packages lazily as their pages are first requested.
+
+    Builds run one at a time on the calling thread, so the job server and the console output
+    behave as they do for a normal run. Each build covers the requested package plus any of its
+    dependencies which have not been documented yet, so their tags are available for linking.
+
+    With an archive_dir, files missing from the docs space are served from the docs archives.
+    """
+    workspace_packages = find_packages(context.source_space_abs, exclude_subspaces=True, warnings=[])
+    packages_by_name = dict((pkg.name, (path, pkg)) for path, pkg in workspace_packages.items())
+    ordered_packages = list(packages_by_name.values())
+
+    docs_space = context.docs_space_abs
+    mkdir_p(docs_space)
+
+    archive_reader = None
+    if document_kwargs.get("archive_dir"):
+        archive_reader = DocsArchiveReader(document_kwargs["archive_dir"])
+
+    def is_documented(name):
+        index_path = posixpath.join(name, "index.html")
+        if os.path.isfile(os.path.join(docs_space, index_path)):
+            return True
+        return archive_reader is not None and archive_reader.read(index_path) is not None
+
+    # Packages whose docs were produced by an earlier run are served as they are.
+    documented = set(name for name in packages_by_name if is_documented(name))
+    lock = threading.Lock()
+    pending = {}
+    build_queue = Queue()
+
+    def request_build(name):
+        if name not in packages_by_name:
+            return
+        with lock:
+            if name in documented:
+                return
+            request = pending.get(name)
+            if request is None:
+                request = pending[name] = _BuildRequest(name)
+                build_queue.put(request)
+        request.done.wait()
+
+    handler = partial(
+        _DocsRequestHandler, directory=docs_space, request_build=request_build, archive_reader=archive_reader
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+
+    log(fmt("[document] @!Serving@| %s on @{cf}http://%s:%d/@|, press Ctrl-C to stop." % (docs_space, host, port)))
+
+    document_kwargs = dict(document_kwargs, no_deps=True, start_with=None)
+    try:
+        while True:
+            request = build_queue.get()
+            path, pkg = packages_by_name[request.package_name]
+            with lock:
+                if request.package_name in documented:
+                    # Already built as a dependency of an earlier request.
+                    pending.pop(request.package_name, request).done.set()
+                    continue
+                names = [request.package_name] + [
+                    dep.name
+                    for _, dep in get_cached_recursive_build_depends_in_workspace(pkg, ordered_packages)
+                    if dep.name not in documented
+                ]
+            try:
+                retcode = document_workspace(
+                    context, packages=names, workspace_packages=workspace_packages, **document_kwargs
+                )
+            finally:
+                # Failures are cached too; the log space has the details and a restart retries them.
+                with lock:
+                    documented.update(names)
+                    for name in names:
+                        if name in pending:
+                            pending.pop(name).done.set()
+            if retcode == 130:
+                return retcode
+    except KeyboardInterrupt:
+        log("[document] Stopped serving.")
+        return 0
+    finally:
+        server.shutdown()
+        server.server_close()
+        if archive_reader is not None:
+            archive_reader.close()
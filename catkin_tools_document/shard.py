@@ -0,0 +1,237 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from argparse import ArgumentTypeError
+from typing import List
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from catkin_tools.common import log
+from catkin_tools.common import mkdir_p
+from catkin_tools.terminal_color import fmt
+
+# Seconds between checks for packages finished by other shards.
+SHARD_POLL_INTERVAL = 2.0
+
+DONE_MARKER_SUFFIX = ".done"
+FAILED_MARKER_SUFFIX = ".failed"
+
+
+def shard_type(shard):
+    """Argparse type for a shard given as "I/N", the I-th (from 1) of N shards, returned as (I, N)."""
+    try:
+        index, count = [int(part) for part in shard.split("/")]
+    except ValueError:
+        raise ArgumentTypeError("expected a shard like 2/4.")
+    if not 1 <= index <= count:
+        raise ArgumentTypeError("shard index must be between 1 and the number of shards.")
+    return index, count
+
+
+def shard_count_type(count):
+    """Argparse type for a number of shards, which must be at least 1."""
+    try:
+        count = int(count)
+    except ValueError:
+        raise ArgumentTypeError("expected a number of shards.")
+    if count < 1:
+        raise ArgumentTypeError("must be at least 1.")
+    return count
+
+
+def shard_markers_path(context):
+    return os.path.join(context.build_space_abs, "docs", ".shards")
+
+
+def assign_shard(package_names: List[str], index: int, count: int) -> List[str]:
+    """Names of the packages documented by shard index of count.
+
+    Packages are dealt out round-robin in the given (topological) order, so every host computes the same
+    assignment from the same workspace, and each shard gets a similar share of every level of the graph.
+    """
+    return package_names[index - 1 :: count]
+
+
+class ShardMarkerWriter(object):
+    """EventQueue listener which records each finished package of this shard for the other shards to see.
+
+    A package is finished once all of its jobs are: its own, and those of its standalone builders.
+    """
+
+    def __init__(self, marker_dir, package_job_ids):
+        self.marker_dir = marker_dir
+        self.pending_job_ids = dict((name, set(job_ids)) for name, job_ids in package_job_ids.items())
+        self.package_of_job = dict((jid, name) for name, job_ids in package_job_ids.items() for jid in job_ids)
+        self.marked = set()
+        mkdir_p(marker_dir)
+        # Anything left by an earlier run for these packages is stale, they're about to be redone.
+        for name in package_job_ids:
+            for suffix in (DONE_MARKER_SUFFIX, FAILED_MARKER_SUFFIX):
+                if os.path.exists(os.path.join(marker_dir, name + suffix)):
+                    os.unlink(os.path.join(marker_dir, name + suffix))
+
+    def mark(self, name, succeeded):
+        if name in self.marked:
+            return
+        self.marked.add(name)
+        suffix = DONE_MARKER_SUFFIX if succeeded else FAILED_MARKER_SUFFIX
+        with open(os.path.join(self.marker_dir, name + suffix), "w"):
+            pass
+
+    def _job_finished(self, job_id, succeeded):
+        name = self.package_of_job.get(job_id)
+        if name is None:
+            return
+        if not succeeded:
+            self.mark(name, False)
+            return
+        self.pending_job_ids[name].discard(job_id)
+        if not self.pending_job_ids[name]:
+            self.mark(name, True)
+
+    def on_event(self, event):
+        if event.event_id == "FINISHED_JOB":
+            self._job_finished(event.data["job_id"], event.data["succeeded"])
+        elif event.event_id == "ABANDONED_JOB":
+            self._job_finished(event.data["job_id"], False)
+
+    def close(self):
+        """Mark whatever didn't finish (eg, on interrupt) as failed, so other shards don't wait for it forever."""
+        for name in self.pending_job_ids:
+            self.mark(name, False)
+
+
+class ShardAdmission(object):
+    """Admission check which holds jobs back until the other shards are done with the packages they need,
+    see scheduler.execute_jobs, so that waiting jobs don't take the job slots which this shard's own
+    packages, which the other shards may in turn be waiting for, need to run.
+
+    A package is done once it has a marker, whether it succeeded or failed; failures are reported by
+    check_shard_packages once the job starts. The markers are looked for at most every SHARD_POLL_INTERVAL.
+    """
+
+    def __init__(self, marker_dir, other_shard_deps, on_wait=None):
+        """
+        :param marker_dir: Directory the shards record finished packages in
+        :param other_shard_deps: Map of job id to the packages documented by other shards which it needs
+        :param on_wait: Called with the job id and the packages it's waiting for the first time it's held back
+        """
+        self.marker_dir = marker_dir
+        self.other_shard_deps = other_shard_deps
+        self.on_wait = on_wait
+        self.finished = set()
+        self._waiting = set()
+        self._next_poll_time = 0.0
+
+    def _poll(self):
+        if time.time() < self._next_poll_time:
+            return
+        self._next_poll_time = time.time() + SHARD_POLL_INTERVAL
+        for name in set().union(*self.other_shard_deps.values()) - self.finished:
+            for suffix in (DONE_MARKER_SUFFIX, FAILED_MARKER_SUFFIX):
+                if os.path.exists(os.path.join(self.marker_dir, name + suffix)):
+                    self.finished.add(name)
+
+    def admit(self, job):
+        package_names = self.other_shard_deps.get(job.jid)
+        if not package_names:
+            return True
+        if not self.finished.issuperset(package_names):
+            self._poll()
+        if self.finished.issuperset(package_names):
+            return True
+        if self.on_wait is not None and job.jid not in self._waiting:
+            self.on_wait(job.jid, sorted(set(package_names) - self.finished))
+        self._waiting.add(job.jid)
+        return False
+
+
+def check_shard_packages(logger, event_queue, marker_dir: str, package_names: List[str]) -> int:
+    """
+    FunctionStage functor that fails the job if other shards failed to document packages it needs.
+    The job is only started once they're all finished, see ShardAdmission.
+
+    :param logger:
+    :param event_queue:
+    :param marker_dir: Directory the shards record finished packages in
+    :param package_names: Packages documented by other shards which this job needs
+    :return: return code
+    """
+    failed = [
+        name
+        for name in sorted(package_names)
+        if not os.path.exists(os.path.join(marker_dir, name + DONE_MARKER_SUFFIX))
+    ]
+    for name in failed:
+        logger.err("Package [%s] failed to document on another shard." % name)
+    return 1 if failed else 0
+
+
+def clear_shard_markers(logger, event_queue, marker_dir: str) -> int:
+    """
+    FunctionStage functor that removes the finished-package records once the shards are merged.
+
+    :param logger:
+    :param event_queue:
+    :param marker_dir: Directory the shards record finished packages in
+    :return: return code
+    """
+    shutil.rmtree(marker_dir, ignore_errors=True)
+    return 0
+
+
+def _strip_option(args, option):
+    """Remove an option and its value from command line arguments."""
+    stripped = []
+    skip_value = False
+    for arg in args:
+        if skip_value:
+            skip_value = False
+        elif arg == option:
+            skip_value = True
+        elif not arg.startswith(option + "="):
+            stripped.append(arg)
+    return stripped
+
+
+def run_local_shards(count, merge):
+    """Stand-in for a pool of build hosts: re-runs this command as count shard processes on this machine.
+
+    The processes share the workspace like hosts sharing a filesystem would. Once they exit, merge is
+    called to build the summary over their combined output.
+
+    :param count: Number of shards
+    :param merge: Callable running the merge step, returning its return code
+    :return: return code
+    """
+    args = _strip_option(sys.argv[1:], "--local-shards")
+    command = [sys.executable, "-c", "from catkin_tools.commands.catkin import main; main()"] + args
+    processes = []
+    for index in range(1, count + 1):
+        log(fmt("[document] Starting shard @!%d/%d@|." % (index, count)))
+        processes.append(
+            subprocess.Popen(command + ["--shard", "%d/%d" % (index, count), "--no-status", "--no-notify"])
+        )
+
+    retcodes = [process.wait() for process in processes]
+    for index, retcode in enumerate(retcodes, start=1):
+        if retcode != 0:
+            log(fmt("[document] @!@{yf}Warning:@| Shard %d/%d exited with code %d." % (index, count, retcode)))
+
+    merge_retcode = merge()
+    return merge_retcode or next((retcode for retcode in retcodes if retcode), 0)
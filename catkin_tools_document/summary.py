@@ -0,0 +1,74 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from html import escape
+
+import json
+import os
+
+from .registry import builder_output_dir
+from .util import write_if_changed
+
+# Written by each package's job next to its summary page, for the workspace summary to list it.
+PACKAGE_SUMMARY_FILENAME = "summary.json"
+
+
+def api_links(rosdoc_conf):
+    """(name, link relative to the package's docs) of each of a package's rosdoc builders."""
+    return [
+        (conf.get("name", conf["builder"]), os.path.join("html", builder_output_dir(conf), "index.html"))
+        for conf in rosdoc_conf or []
+    ]
+
+
+def write_package_summary_file(output_path, package, rosdoc_conf, msg_names, srv_names):
+    """Write the metadata of a documented package which the workspace summary and search index use."""
+    summary = dict(
+        name=package.name,
+        description=package.description,
+        api=api_links(rosdoc_conf),
+        msg=msg_names,
+        srv=srv_names,
+    )
+    write_if_changed(os.path.join(output_path, PACKAGE_SUMMARY_FILENAME), json.dumps(summary, indent=1, sort_keys=True))
+
+
+def read_package_summaries(output_path, package_names):
+    """Metadata of the given packages whose jobs wrote it, see write_package_summary_file."""
+    summaries = []
+    for name in sorted(package_names):
+        try:
+            with open(os.path.join(output_path, name, PACKAGE_SUMMARY_FILENAME)) as f:
+                summaries.append(json.load(f))
+        except (OSError, ValueError):
+            # Not documented (yet), or its job failed before writing the summary.
+            continue
+    return summaries
+
+
+def package_list_html(summaries):
+    """Lines of HTML which list packages with their descriptions, linking to their summary pages and API docs.
+
+    Descriptions are HTML, like on the packages' own summary pages, so they're included unescaped.
+    """
+    lines = ["<dl>"]
+    for summary in summaries:
+        name = escape(summary["name"])
+        lines.append('<dt><a href="%s/index.html">%s</a></dt>' % (name, name))
+        api = " ".join(
+            '<a href="%s/%s">%s</a>' % (name, escape(link), escape(api_name)) for api_name, link in summary["api"]
+        )
+        lines.append("<dd>%s%s</dd>" % (summary["description"].strip(), " &mdash; API: " + api if api else ""))
+    lines.append("</dl>")
+    return lines
@@ -0,0 +1,144 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import ThreadPoolExecutor
+
+import hashlib
+import importlib.metadata
+import importlib.util
+import json
+import os
+import subprocess
+
+from catkin_tools.common import mkdir_p
+
+from .util import which
+from .util import write_if_changed
+
+# Arguments which make each command-line tool print its version.
+VERSION_ARGS = {
+    "doxygen": ["--version"],
+    "dot": ["-V"],
+    "sphinx-build": ["--version"],
+    "epydoc": ["--version"],
+    "jsdoc": ["--version"],
+    "redocly": ["--version"],
+}
+
+# Tools which run in-process, as Python modules, rather than as commands; mapped to their distribution.
+PYTHON_TOOLS = {"pydoctor": "pydoctor"}
+
+VERSION_TIMEOUT = 10.0
+
+
+def toolchain_cache_path(context):
+    return os.path.join(context.build_space_abs, "docs", ".toolchain.json")
+
+
+def _command_version(path):
+    name = os.path.basename(path)
+    try:
+        output = subprocess.run(
+            [path] + VERSION_ARGS.get(name, ["--version"]),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            timeout=VERSION_TIMEOUT,
+            check=False,
+        ).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    lines = output.decode("utf-8", "replace").strip().splitlines()
+    return lines[0].strip() if lines else ""
+
+
+class Toolchain(object):
+    """The path and version of each documentation tool which a run uses, probed once per run.
+
+    Versions are cached across runs by the path, size and mtime of each tool, so a tool is only
+    run to ask for its version after it's installed or upgraded.
+    """
+
+    def __init__(self, tools):
+        self.tools = dict((name, (None, None)) for name in tools)
+
+    def path(self, name):
+        return self.tools.get(name, (None, None))[0]
+
+    def version(self, name):
+        return self.tools.get(name, (None, None))[1]
+
+    def missing(self, names):
+        """The given tools which aren't installed. A tuple of alternatives is missing if none of them is."""
+        return [
+            name
+            for name in names
+            if all(self.path(alternative) is None for alternative in (name if isinstance(name, tuple) else (name,)))
+        ]
+
+    def fingerprint(self, names):
+        """Hash of the paths and versions of the given tools, for keying what they produce."""
+        h = hashlib.sha256()
+        for name in sorted(set(names)):
+            path, version = self.tools.get(name, (None, None))
+            h.update(("%s\0%s\0%s\n" % (name, path, version)).encode())
+        return h.hexdigest()
+
+    def probe(self, cache_path=None):
+        """Resolve and version each tool, in parallel for those not cached at cache_path."""
+        cache = {}
+        if cache_path is not None:
+            try:
+                with open(cache_path) as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+        stats = {}
+        pending = {}
+        with ThreadPoolExecutor(max_workers=max(1, len(self.tools))) as executor:
+            for name in self.tools:
+                if name in PYTHON_TOOLS:
+                    spec = importlib.util.find_spec(name)
+                    if spec is None:
+                        continue
+                    try:
+                        version = importlib.metadata.version(PYTHON_TOOLS[name])
+                    except importlib.metadata.PackageNotFoundError:
+                        version = ""
+                    self.tools[name] = (spec.origin, version)
+                    continue
+
+                path = which(name)
+                if path is None:
+                    continue
+                st = os.stat(path)
+                stats[name] = [path, st.st_size, st.st_mtime_ns]
+                cached = cache.get(name)
+                if cached is not None and cached["stat"] == stats[name]:
+                    self.tools[name] = (path, cached["version"])
+                else:
+                    pending[name] = executor.submit(_command_version, path)
+
+        for name, future in pending.items():
+            self.tools[name] = (stats[name][0], future.result())
+
+        if cache_path is not None and pending:
+            cache.update(
+                (name, dict(stat=stats[name], version=self.tools[name][1]))
+                for name in stats
+                if self.tools[name][1] is not None
+            )
+            mkdir_p(os.path.dirname(cache_path))
+            write_if_changed(cache_path, json.dumps(cache, indent=1, sort_keys=True))
+        return self
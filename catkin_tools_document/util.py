@@ -17,8 +17,9 @@ from typing import List
 from typing import Union
 
 from functools import lru_cache
+import hashlib
 import os
-import yaml
+import threading
 
 from catkin_tools.common import mkdir_p
 from catkin_tools.execution.events import ExecutionEvent
@@ -28,15 +29,48 @@ def output_dir_file(builder: str) -> str:
     return f"{builder}_output"
 
 
+def input_fingerprint_file(builder: str) -> str:
+    return f"{builder}_fingerprint"
+
+
 @lru_cache
 def which(program):
     for path in os.environ["PATH"].split(os.pathsep):
         path = path.strip('"')
         executable = os.path.join(path, program)
-        if os.path.isfile(executable):
+        if os.path.isfile(executable) and os.access(executable, os.X_OK):
             return executable
 
 
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's contents, as hex."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_if_changed(path: str, contents: str) -> bool:
+    """Write a text file unless it already has these contents, so its mtime only changes with them.
+
+    :returns: Whether the file was written
+    """
+    try:
+        with open(path) as f:
+            if f.read() == contents:
+                return False
+    except OSError:
+        pass
+    # Replace the file in one go, as it may be served while the docs are being built. The temporary
+    # file is unique to the thread and process, since shards may write the same file at once.
+    tmp_path = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+    with open(tmp_path, "w") as f:
+        f.write(contents)
+    os.replace(tmp_path, path)
+    return True
+
+
 def unset_env(logger, event_queue, job_env: dict, keys: Union[List[str], None] = None) -> int:
     """
     FunctionStage functor that removes keys from the job_env.
@@ -89,7 +123,7 @@ def write_file(logger, event_queue, contents: Any, dest_path: str, mode: str = "
     return 0
 
 
-def yaml_dump_file(logger, event_queue, contents: Any, dest_path: str, dumper=yaml.SafeDumper) -> int:
+def yaml_dump_file(logger, event_queue, contents: Any, dest_path: str, dumper=None) -> int:
     """
     FunctionStage functor that dumps the contents of an object, which is accepted by yaml dumper, to a file.
     In case the file exists, the file is overwritten.
@@ -101,8 +135,11 @@ def yaml_dump_file(logger, event_queue, contents: Any, dest_path: str, dumper=ya
     :param dumper: Yaml dumper to use (default: yaml.SafeDumper)
     :return: return code
     """
+    # Imported here, as this module is loaded along with the verb's arguments.
+    import yaml
+
     mkdir_p(os.path.dirname(dest_path))
     with open(dest_path, "w") as f:
-        yaml.dump(contents, f, dumper)
+        yaml.dump(contents, f, dumper or yaml.SafeDumper)
 
     return 0
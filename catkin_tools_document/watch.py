@@ -0,0 +1,180 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+
+from catkin_pkg.packages import find_package_paths
+from catkin_pkg.packages import find_packages
+from catkin_pkg.topological_order import topological_order_packages
+
+from catkin_tools.common import log
+from catkin_tools.common import get_cached_recursive_build_depends_in_workspace
+from catkin_tools.terminal_color import fmt
+
+from .document import document_workspace
+
+
+def _snapshot_package(package_path_abs):
+    """Map every source file of a package to its (mtime, size), skipping hidden directories."""
+    snapshot = {}
+    pending = [package_path_abs]
+    while pending:
+        try:
+            entries = list(os.scandir(pending.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file():
+                    st = entry.stat()
+                    snapshot[entry.path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                continue
+    return snapshot
+
+
+def _snapshot_workspace(context):
+    """Map the path of every package in the source space to the snapshot of its files.
+
+    The source space is searched again each time, so that added and removed packages are noticed.
+    """
+    package_paths = find_package_paths(context.source_space_abs, exclude_subspaces=True)
+    return dict((path, _snapshot_package(os.path.join(context.source_space_abs, path))) for path in package_paths)
+
+
+def _doc_dependents(workspace_packages):
+    """Map each package name to the names of all workspace packages which (recursively) depend on it,
+    and to those it depends on.
+
+    :returns: Both maps, or None for both if the packages have a circular dependency
+    """
+    ordered_packages = topological_order_packages(dict(workspace_packages))
+    # A cycle is reported in place of the packages, as an entry without a path.
+    if any(path is None for path, _ in ordered_packages):
+        return None, None
+    dependents = {pkg.name: set() for _, pkg in ordered_packages}
+    dependencies = {}
+    for _, pkg in ordered_packages:
+        dependencies[pkg.name] = set(
+            dep.name for _, dep in get_cached_recursive_build_depends_in_workspace(pkg, ordered_packages)
+        )
+        for dep_name in dependencies[pkg.name]:
+            dependents.setdefault(dep_name, set()).add(pkg.name)
+    return dependents, dependencies
+
+
+def _manifest_changed(old_files, new_files):
+    return any(
+        os.path.basename(path) == "package.xml" and old_files.get(path) != stat for path, stat in new_files.items()
+    )
+
+
+def watch_workspace(context, packages=None, interval=1.0, **document_kwargs):
+    """Document the workspace, then keep re-documenting the packages affected by source changes.
+
+    The workspace model (package list and reverse dependencies) is kept in memory between runs and
+    only rebuilt when a package is added or removed, or a package.xml changes. Each change re-runs
+    the changed packages and their doc-dependents, without their (unchanged) dependencies. Once a
+    circular dependency between the packages is fixed, all of them are re-run.
+    """
+    workspace_packages = find_packages(context.source_space_abs, exclude_subspaces=True, warnings=[])
+    dependents, dependencies = _doc_dependents(workspace_packages)
+    snapshot = _snapshot_workspace(context)
+
+    # Later runs only cover the affected packages, they don't restart the requested order.
+    rerun_kwargs = dict(document_kwargs, no_deps=True, start_with=None)
+
+    retcode = document_workspace(context, packages=packages, workspace_packages=workspace_packages, **document_kwargs)
+    if retcode == 130:
+        return retcode
+
+    log(fmt("[document] @!Watching@| %d packages for changes, press Ctrl-C to stop." % len(workspace_packages)))
+
+    try:
+        while True:
+            time.sleep(interval)
+            new_snapshot = _snapshot_workspace(context)
+            changed_paths = set(
+                path for path in set(snapshot) | set(new_snapshot) if snapshot.get(path) != new_snapshot.get(path)
+            )
+            if not changed_paths:
+                continue
+            snapshot, old_snapshot = new_snapshot, snapshot
+
+            # Packages are named by the model they were in, so that removed ones are named too.
+            changed = set(workspace_packages[path].name for path in changed_paths if path in workspace_packages)
+            old_dependents = dependents
+            if (
+                dependents is None
+                or set(new_snapshot) != set(old_snapshot)
+                or any(
+                    _manifest_changed(old_snapshot.get(path, {}), new_snapshot[path])
+                    for path in changed_paths
+                    if path in new_snapshot
+                )
+            ):
+                # Reload the workspace model rather than try to patch it.
+                try:
+                    workspace_packages = find_packages(context.source_space_abs, exclude_subspaces=True, warnings=[])
+                except RuntimeError as ex:
+                    # Eg, two packages with the same name, until one of them is renamed.
+                    log(fmt("[document] @!@{rf}Error:@| %s" % ex))
+                    continue
+                dependents, dependencies = _doc_dependents(workspace_packages)
+                if dependents is None:
+                    # Documenting would exit on it, so wait for it to be fixed, then document everything.
+                    log(
+                        fmt(
+                            "[document] @!@{rf}Error:@| The workspace packages have a circular dependency, "
+                            "waiting for it to be fixed."
+                        )
+                    )
+                    continue
+                changed.update(workspace_packages[path].name for path in changed_paths if path in workspace_packages)
+
+            package_names = set(pkg.name for pkg in workspace_packages.values())
+            if old_dependents is None:
+                affected = set(package_names)
+            else:
+                affected = set(changed)
+                for name in changed:
+                    # Dependents of a removed package are only in the old model.
+                    affected.update(dependents.get(name, ()))
+                    affected.update(old_dependents.get(name, ()))
+            affected &= package_names
+
+            if packages:
+                # Stay within the requested packages and (unless --no-deps) their dependencies.
+                scope = set(packages)
+                if not document_kwargs.get("no_deps"):
+                    for name in packages:
+                        scope.update(dependencies.get(name, ()))
+                affected &= scope
+            if not affected:
+                continue
+
+            log(fmt("[document] @!Changed:@| %s" % " ".join(sorted(changed))))
+            retcode = document_workspace(
+                context, packages=sorted(affected), workspace_packages=workspace_packages, **rerun_kwargs
+            )
+            if retcode == 130:
+                return retcode
+    except KeyboardInterrupt:
+        log("[document] Stopped watching.")
+        return 0
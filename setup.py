@@ -28,6 +28,16 @@ setup(
         "catkin_tools.spaces": [
             "docs = catkin_tools_document.spaces.docs:description",
         ],
+        "catkin_tools_document.builders": [
+            "doxygen = catkin_tools_document.builders:doxygen_description",
+            "epydoc = catkin_tools_document.builders:epydoc_description",
+            "jsdoc = catkin_tools_document.builders:jsdoc_description",
+            "openapi = catkin_tools_document.builders:openapi_description",
+            "pyast = catkin_tools_document.builders:pyast_description",
+            "pydoctor = catkin_tools_document.builders:pydoctor_description",
+            "sphinx = catkin_tools_document.builders:sphinx_description",
+            "swagger = catkin_tools_document.builders:openapi_description",
+        ],
     },
     python_version=">=3.8",
     install_requires=[
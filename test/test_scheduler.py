@@ -0,0 +1,146 @@
+# Copyright 2016 Clearpath Robotics Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from catkin_tools.execution import job_server
+from catkin_tools.execution.executor import run_until_complete
+from catkin_tools.execution.jobs import Job
+from catkin_tools.execution.stages import FunctionStage
+
+from catkin_tools_document.events import EventQueue
+from catkin_tools_document.memory import MemoryBudget
+from catkin_tools_document.scheduler import execute_jobs
+from catkin_tools_document.shard import ShardAdmission
+from catkin_tools_document.shard import ShardMarkerWriter
+from catkin_tools_document.shard import check_shard_packages
+
+import catkin_tools_document.shard
+
+WORKERS = 4
+
+
+def _start_jobs(log_path, jobs, n_jobs, admission_checks, listeners=()):
+    if not job_server.initialized():
+        job_server.initialize(max_jobs=WORKERS, max_load=None, gnu_make_enabled=False)
+    assert job_server.max_jobs() == WORKERS
+    event_queue = EventQueue(list(listeners))
+    result = {}
+
+    def run():
+        result["succeeded"] = run_until_complete(
+            execute_jobs(
+                "test",
+                jobs,
+                None,
+                event_queue,
+                str(log_path),
+                max_toplevel_jobs=n_jobs,
+                admit=lambda job: all(check(job) for check in admission_checks),
+            )
+        )
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    return thread, result
+
+
+def _join_jobs(thread, result):
+    thread.join(30.0)
+    assert not thread.is_alive(), "the jobs deadlocked"
+    return result["succeeded"]
+
+
+def _run_jobs(log_path, jobs, n_jobs, admission_checks, listeners=()):
+    return _join_jobs(*_start_jobs(log_path, jobs, n_jobs, admission_checks, listeners))
+
+
+def _sleep(logger, event_queue, running, peak):
+    with running["lock"]:
+        running["count"] += 1
+        peak.append(running["count"])
+    time.sleep(0.05)
+    with running["lock"]:
+        running["count"] -= 1
+    return 0
+
+
+def _jobs(count, running, peak):
+    # Two FunctionStages each, so a job needs a pool thread again after it was admitted.
+    return [
+        Job(
+            jid="job%d" % index,
+            deps=[],
+            env={},
+            stages=[FunctionStage("sleep", _sleep, running=running, peak=peak) for _ in range(2)],
+        )
+        for index in range(count)
+    ]
+
+
+def test_memory_budget_with_more_jobs_than_workers(tmp_path):
+    running = dict(lock=threading.Lock(), count=0)
+    peak = []
+    jobs = _jobs(3 * WORKERS, running, peak)
+    budget = MemoryBudget(300, dict((job.jid, 100) for job in jobs))
+    assert _run_jobs(tmp_path, jobs, 2 * WORKERS, [budget.admit], listeners=[budget.on_event])
+    assert max(peak) <= 3
+    assert not budget.reserved
+
+
+def test_memory_budget_admits_oversized_job_alone(tmp_path):
+    running = dict(lock=threading.Lock(), count=0)
+    peak = []
+    jobs = _jobs(WORKERS, running, peak)
+    budget = MemoryBudget(100, dict((job.jid, 1000) for job in jobs))
+    assert _run_jobs(tmp_path, jobs, 2 * WORKERS, [budget.admit], listeners=[budget.on_event])
+    assert max(peak) == 1
+
+
+def test_shards_waiting_on_each_other(tmp_path, monkeypatch):
+    monkeypatch.setattr(catkin_tools_document.shard, "SHARD_POLL_INTERVAL", 0.01)
+    marker_dir = str(tmp_path / "markers")
+    running = dict(lock=threading.Lock(), count=0)
+    peak = []
+
+    # Each shard runs one job at a time, and the first of its jobs needs a package of the other shard.
+    runs = []
+    for own, other in (("a", "b"), ("b", "a")):
+        jobs = [
+            Job(
+                jid="%s_dependent" % own,
+                deps=[],
+                env={},
+                stages=[
+                    FunctionStage(
+                        "check_shards", check_shard_packages, marker_dir=marker_dir, package_names=["%s_base" % other]
+                    )
+                ],
+            ),
+            Job(
+                jid="%s_base" % own,
+                deps=[],
+                env={},
+                stages=[FunctionStage("sleep", _sleep, running=running, peak=peak)],
+            ),
+        ]
+        writer = ShardMarkerWriter(marker_dir, dict((job.jid, [job.jid]) for job in jobs))
+        admission = ShardAdmission(marker_dir, {"%s_dependent" % own: ["%s_base" % other]})
+        (tmp_path / own).mkdir()
+        runs.append(_start_jobs(tmp_path / own, jobs, 1, [admission.admit], listeners=[writer.on_event]))
+
+    for thread, result in runs:
+        assert _join_jobs(thread, result)